@@ -4,7 +4,10 @@ from pydantic import BaseModel, Field
 from typing import Dict, Any, List
 from dotenv import load_dotenv
 
-load_dotenv()
+# Carrega o .env uma única vez por processo (inclusive em subprocessos que herdam o ambiente)
+if not os.getenv('_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_DOTENV_LOADED'] = '1'
 
 class AgentConfig(BaseModel):
     """Configurações globais do agente"""
@@ -21,13 +24,17 @@ class AgentConfig(BaseModel):
 
 class ToolsConfig(BaseModel):
     """Configurações das ferramentas"""
+    # Nomes (campo "name" dos metadados) das ferramentas anexadas ao agente;
+    # os módulos das demais não são importados
     enabled_tools: List[str] = Field(default_factory=lambda: [
         "calculator",
         "password_generator", 
         "unit_converter",
         "task_manager",
-        "text_analyzer"
+        "text_analyzer",
+        "informacoes_data",  # Data e hora atual
         "calendar_reader",   # Nome da ferramenta para listar compromissos
+        "list_calendars",    # Nome da ferramenta para listar calendários
         "calendar_scheduler",# Nome da ferramenta para agendar compromissos
         "calendar_deleter"   # Nome da ferramenta para deletar compromissos
     ])
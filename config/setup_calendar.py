@@ -7,24 +7,30 @@ Integrado ao sistema de ChatBot Modular
 
 import os
 import sys
-import pickle
+import importlib.util
 from pathlib import Path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 # Adicionar diretório raiz ao path para imports
 sys.path.append(str(Path(__file__).parent.parent))
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
+# Máximo de requisições aceitas pela API do Google em uma única chamada batch
+BATCH_LIMIT = 50
+
 def print_header():
     """Cabeçalho do script"""
     print("🗓️  CONFIGURAÇÃO GOOGLE CALENDAR")
     print("="*50)
 
+def is_module_available(import_name: str) -> bool:
+    """Verifica se um módulo pode ser importado sem executar o seu código"""
+    try:
+        return importlib.util.find_spec(import_name) is not None
+    except ModuleNotFoundError:
+        # O pacote pai (ex.: google_auth_oauthlib em google_auth_oauthlib.flow) não existe
+        return False
+
 def check_requirements():
     """Verifica dependências necessárias"""
     print("\n🔍 Verificando dependências...")
@@ -38,10 +44,9 @@ def check_requirements():
     missing = []
     
     for package, import_name in required_packages.items():
-        try:
-            __import__(import_name)
+        if is_module_available(import_name):
             print(f"   ✅ {package}")
-        except ImportError:
+        else:
             print(f"   ❌ {package}")
             missing.append(package)
     
@@ -96,28 +101,28 @@ def setup_authentication():
     """Configura autenticação OAuth"""
     print("\n🔑 Configurando autenticação...")
     
+    # Importados aqui, depois de check_requirements confirmar que estão instalados
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    
     # Criar diretório data se não existir
     os.makedirs('data', exist_ok=True)
     
-    token_file = 'data/calendar_token.pickle'
+    from core.oauth_scheduler import TOKEN_FILE as token_file, read_token
     creds = None
     
-    # Verificar token existente
-    if os.path.exists(token_file):
+    # Verificar token existente (um token .pickle antigo é convertido para JSON)
+    try:
+        creds = read_token(token_file)
+    except Exception as e:
+        print(f"   ❌ Erro ao ler token: {e}")
+    
+    if creds:
         print("   📄 Token existente encontrado")
-        try:
-            with open(token_file, 'rb') as token:
-                creds = pickle.load(token)
-            
-            if creds and creds.valid:
-                print("   ✅ Token válido - autenticação OK!")
-                return creds
-            
-            print("   ⚠️  Token expirado - renovando...")
-            
-        except Exception as e:
-            print(f"   ❌ Erro ao ler token: {e}")
-            creds = None
+        if creds.valid:
+            print("   ✅ Token válido - autenticação OK!")
+            return creds
+        print("   ⚠️  Token expirado - renovando...")
     
     # Renovar ou criar novo token
     if creds and creds.expired and creds.refresh_token:
@@ -144,8 +149,9 @@ def setup_authentication():
     
     # Salvar token
     try:
-        with open(token_file, 'wb') as token:
-            pickle.dump(creds, token)
+        # Escrita atômica: uma falha no meio não corrompe o token (o que forçaria novo login)
+        from core.oauth_scheduler import write_token_atomically
+        write_token_atomically(creds, token_file)
         print(f"   💾 Token salvo em: {token_file}")
         
     except Exception as e:
@@ -157,6 +163,9 @@ def test_calendar_access(creds):
     """Testa acesso ao calendário"""
     print("\n🧪 Testando acesso ao calendário...")
     
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+    
     try:
         service = build('calendar', 'v3', credentials=creds)
         
@@ -185,17 +194,38 @@ def test_calendar_access(creds):
         now = datetime.now(sao_paulo_tz)
         week_later = now + timedelta(days=7)
         
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=now.isoformat(),
-            timeMax=week_later.isoformat(),
-            maxResults=5,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        # Uma única requisição batch (multipart) por bloco de até 50 calendários,
+        # em vez de um round-trip HTTPS por calendário
+        events_by_calendar = {}
+        failed_calendars = []
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                failed_calendars.append(request_id)
+            else:
+                events_by_calendar[request_id] = response.get('items', [])
+
+        for start in range(0, len(calendars), BATCH_LIMIT):
+            batch = service.new_batch_http_request(callback=collect)
+            for calendar in calendars[start:start + BATCH_LIMIT]:
+                batch.add(
+                    service.events().list(
+                        calendarId=calendar['id'],
+                        timeMin=now.isoformat(),
+                        timeMax=week_later.isoformat(),
+                        maxResults=5,
+                        singleEvents=True,
+                        orderBy='startTime'
+                    ),
+                    request_id=calendar['id']
+                )
+            batch.execute()
         
-        events = events_result.get('items', [])
-        print(f"   ✅ {len(events)} evento(s) encontrado(s) nos próximos 7 dias")
+        total_events = sum(len(events) for events in events_by_calendar.values())
+        print(f"   ✅ {total_events} evento(s) encontrado(s) nos próximos 7 dias "
+              f"em {len(events_by_calendar)} calendário(s)")
+        if failed_calendars:
+            print(f"   ⚠️  Não foi possível consultar {len(failed_calendars)} calendário(s)")
         
         return True
         
@@ -4,10 +4,140 @@ from config.settings import agent_config, tools_config
 from models.context import ConversationContext
 from core.tool_registry import tool_registry
 from typing import Dict, Any, List
+import asyncio
+from collections import OrderedDict
 from datetime import datetime
+from functools import cache
 import os
 from typing import Annotated
 
+# Salvar o contexto pelo menos a cada N turnos, mesmo sem alterações relevantes
+CONTEXT_FLUSH_INTERVAL = 10
+
+# Parte fixa do perfil do agente, montada uma única vez no import
+_STATIC_PROFILE = (
+    "Você é um assistente de produtividade e gestão de tempo altamente eficiente. "
+    "Seu objetivo é ajudar o usuário a tomar decisões, organizar tarefas, e otimizar seu tempo e trabalho. "
+    "Você é proativo, analítico e objetivo. "
+    "Use o histórico de conversas e as informações salvas para entender as necessidades, preferências e o estilo de trabalho do usuário. "
+    "Sua resposta deve ser sempre personalizada, como se estivesse a ter uma conversa contínua. "
+    "Utilize as ferramentas disponíveis de forma inteligente para oferecer soluções e sugestões. "
+    "Por exemplo, se o usuário mencionar 'reunião', sugira usar a ferramenta de calendário. Se ele disser 'preciso de uma senha', use a ferramenta de gerador de senhas. "
+    "Quando lhe pedirem uma opinião, baseie-a nos fatos e no contexto que você tem, explicando o porquê de sua sugestão. "
+    "Lembre-se de ser conciso e focado em soluções. "
+    "Responda sempre em português brasileiro e explique brevemente o que está a fazer ao usar uma ferramenta."
+)
+
+# Máximo de gerenciadores (contexto + histórico por usuário) mantidos em memória
+MAX_ACTIVE_MANAGERS = 128
+
+_managers: "OrderedDict[str, AgentManager]" = OrderedDict()
+
+def build_system_prompt(context: ConversationContext) -> str:
+    """Prompt do sistema personalizado, com histórico de conversas e foco em produtividade."""
+    
+    user_name = context.custom_data.user_name
+    
+    # Adicionar o histórico de conversas ao prompt (load_chat_history já
+    # retorna apenas mensagens de usuário e bot)
+    history_str = (
+        "## Histórico de Conversa para Contexto e Decisão:\n\n"
+        + "\n".join(f"{msg['sender'].title()}: {msg['message_text']}" for msg in context.chat_history)
+        + "\n\n---\n\n"
+    ) if context.chat_history else ""
+
+    if user_name:
+        greeting = f"Olá, {user_name}! "
+    else:
+        greeting = "Olá! "
+
+    return f"{history_str}## Perfil do Agente e Funções:\n\n{greeting}{_STATIC_PROFILE}"
+
+def load_tools(agent: Agent):
+    """Carrega e anexa ferramentas ao agente"""
+    if tools_config.auto_discovery and not tool_registry.tools:
+        discovered = tool_registry.auto_discover_tools(tools_config.tools_directory)
+        print(f"🔍 Descobertas {len(discovered)} ferramentas automaticamente")
+
+    # Anexar ao agente só as ferramentas habilitadas: os módulos das demais
+    # continuam sem ser importados
+    tool_registry.attach_tools_to_agent(
+        agent, tool_registry.enabled_tool_names(tools_config.enabled_tools)
+    )
+
+    # Listar ferramentas carregadas
+    tools_list = tool_registry.list_tools()
+    print(f"🛠️  Total de {len(tools_list)} ferramentas disponíveis")
+
+@cache
+def get_or_build_agent() -> Agent:
+    """
+    Cria o agente uma única vez por processo. O agente não guarda estado de
+    usuário: contexto e histórico chegam a cada execução via `deps`.
+    """
+
+    # Validar configurações
+    agent_config.validate_config()
+
+    # Criar agente
+    agent = Agent(
+        agent_config.model,
+        deps_type=ConversationContext
+    )
+
+    # O prompt é montado a cada execução a partir do contexto do usuário
+    @agent.system_prompt
+    def user_system_prompt(ctx: RunContext[ConversationContext]) -> str:
+        return build_system_prompt(ctx.deps)
+
+    # Carregar ferramentas
+    load_tools(agent)
+
+    # Adicionar ferramenta para salvar o nome do usuário
+    @agent.tool
+    async def save_user_name(ctx: RunContext[ConversationContext], name: Annotated[str, "O nome do usuário"]) -> str:
+        """Salva o nome do usuário para referências futuras."""
+        ctx.deps.set_user_data('user_name', name)
+        return f"Ok, salvei seu nome como {name}."
+
+    # Adicionar ferramenta para verificar a persistência de dados
+    @agent.tool
+    async def check_data_persistence(ctx: RunContext[ConversationContext]) -> str:
+        """Informa o usuário sobre a política de persistência de dados do chatbot."""
+        return (
+            "Sim, seus dados de contexto e histórico de conversa são salvos de forma persistente "
+            "em um banco de dados PostgreSQL para que eu possa lembrar de você. "
+            "Isso me permite manter o contexto entre sessões. "
+            "Seus dados estão associados ao seu ID de usuário único e são protegidos por mecanismos de segurança do banco de dados."
+        )
+
+    print("🤖 Agente configurado com sucesso!")
+    return agent
+
+async def get_agent_manager(user_id: str) -> "AgentManager":
+    """
+    Retorna o gerenciador do usuário, reaproveitando-o entre chamadas.
+    Os menos usados recentemente são salvos e descartados acima do limite.
+    """
+    manager = _managers.get(user_id)
+    if manager is not None:
+        _managers.move_to_end(user_id)
+        return manager
+
+    manager = AgentManager(user_id)
+    await manager.setup_agent()
+    # Outra chamada pode ter criado o gerenciador enquanto este carregava
+    if user_id in _managers:
+        _managers.move_to_end(user_id)
+        return _managers[user_id]
+
+    _managers[user_id] = manager
+    while len(_managers) > MAX_ACTIVE_MANAGERS:
+        _, evicted = _managers.popitem(last=False)
+        if not evicted.context.load_failed and (evicted.context.is_dirty or evicted.turns_since_flush):
+            await asyncio.to_thread(evicted.save_context)
+    return manager
+
 class AgentManager:
     """Gerenciador principal do agente"""
 
@@ -16,118 +146,64 @@ class AgentManager:
         self.agent = None
         self.context = None
         self.chat_history = [] # Inicializa o histórico de chat
-        self.setup_agent()
-
-    def setup_agent(self):
-        """Configura o agente principal"""
+        self.turns_since_flush = 0 # Turnos desde o último salvamento do contexto
 
-        # Validar configurações
-        agent_config.validate_config()
+    async def setup_agent(self):
+        """
+        Carrega o estado do usuário e associa o agente compartilhado.
+        Chamado por get_agent_manager, logo após a criação do gerenciador.
+        """
 
-        # Carregar o contexto do banco de dados usando o user_id
+        # Carregar o contexto do banco de dados usando o user_id; psycopg2 é
+        # bloqueante, então as consultas rodam numa thread fora do event loop
         from core.persistence import load_context, load_chat_history
-        self.context = load_context(self.user_id)
+        self.context = await asyncio.to_thread(load_context, self.user_id)
         
         # Carregar o histórico de conversas
-        self.chat_history = load_chat_history(self.user_id, limit=10)
+        self.chat_history = await asyncio.to_thread(load_chat_history, self.user_id, 10)
+        self.context.set_chat_history(self.chat_history)
 
-        # Criar agente
-        self.agent = Agent(
-            agent_config.model,
-            deps_type=ConversationContext,
-            system_prompt=self.get_system_prompt()
-        )
+        # Agente compartilhado entre usuários
+        self.agent = get_or_build_agent()
 
-        # Carregar ferramentas
-        self.load_tools()
-
-        # Adicionar ferramenta para salvar o nome do usuário
-        @self.agent.tool
-        async def save_user_name(ctx: RunContext[ConversationContext], name: Annotated[str, "O nome do usuário"]) -> str:
-            """Salva o nome do usuário para referências futuras."""
-            ctx.deps.custom_data['user_name'] = name
-            return f"Ok, salvei seu nome como {name}."
-
-        # Adicionar ferramenta para verificar a persistência de dados
-        @self.agent.tool
-        async def check_data_persistence(ctx: RunContext[ConversationContext]) -> str:
-            """Informa o usuário sobre a política de persistência de dados do chatbot."""
-            return (
-                "Sim, seus dados de contexto e histórico de conversa são salvos de forma persistente "
-                "em um banco de dados PostgreSQL para que eu possa lembrar de você. "
-                "Isso me permite manter o contexto entre sessões. "
-                "Seus dados estão associados ao seu ID de usuário único e são protegidos por mecanismos de segurança do banco de dados."
-            )
-
-        print("🤖 Agente configurado com sucesso!")
+        # Renovar o token do Google Calendar antes de expirar, fora do caminho do chat
+        from core.oauth_scheduler import start_token_refresher
+        start_token_refresher()
 
     def get_system_prompt(self) -> str:
-        """Prompt do sistema personalizado, com histórico de conversas e foco em produtividade."""
-        
-        user_name = self.context.custom_data.get('user_name', None)
-        
-        # Adicionar o histórico de conversas ao prompt
-        history_str = ""
-        if self.chat_history:
-            # Filtra o histórico para mostrar apenas mensagens de usuário e bot
-            filtered_history = [f"{msg['sender'].title()}: {msg['message_text']}" for msg in self.chat_history if msg['sender'] in ('user', 'bot')]
-            history_str = "\n".join(filtered_history)
-            history_str = f"## Histórico de Conversa para Contexto e Decisão:\n\n{history_str}\n\n---\n\n"
-
-        if user_name:
-            greeting = f"Olá, {user_name}! "
-        else:
-            greeting = "Olá! "
-
-        return (
-            f"{history_str}"
-            f"## Perfil do Agente e Funções:\n\n"
-            f"{greeting}Você é um assistente de produtividade e gestão de tempo altamente eficiente. "
-            "Seu objetivo é ajudar o usuário a tomar decisões, organizar tarefas, e otimizar seu tempo e trabalho. "
-            "Você é proativo, analítico e objetivo. "
-            "Use o histórico de conversas e as informações salvas para entender as necessidades, preferências e o estilo de trabalho do usuário. "
-            "Sua resposta deve ser sempre personalizada, como se estivesse a ter uma conversa contínua. "
-            "Utilize as ferramentas disponíveis de forma inteligente para oferecer soluções e sugestões. "
-            "Por exemplo, se o usuário mencionar 'reunião', sugira usar a ferramenta de calendário. Se ele disser 'preciso de uma senha', use a ferramenta de gerador de senhas. "
-            "Quando lhe pedirem uma opinião, baseie-a nos fatos e no contexto que você tem, explicando o porquê de sua sugestão. "
-            "Lembre-se de ser conciso e focado em soluções. "
-            "Responda sempre em português brasileiro e explique brevemente o que está a fazer ao usar uma ferramenta."
-        )
-
-    def load_tools(self):
-        """Carrega e anexa ferramentas ao agente"""
-        if tools_config.auto_discovery:
-            discovered = tool_registry.auto_discover_tools(tools_config.tools_directory)
-            print(f"🔍 Descobertas {len(discovered)} ferramentas automaticamente")
-
-        # Anexar ferramentas ao agente
-        tool_registry.attach_tools_to_agent(self.agent)
-
-        # Listar ferramentas carregadas
-        tools_list = tool_registry.list_tools()
-        print(f"🛠️  Total de {len(tools_list)} ferramentas disponíveis")
+        """Prompt do sistema para o usuário deste gerenciador"""
+        return build_system_prompt(self.context)
 
     async def chat(self, message: str) -> str:
         """Processa mensagem do usuário"""
         try:
             # Importar a função de salvar do módulo de persistência
-            from core.persistence import save_context, save_chat_message
+            from core.persistence import persist_turn
 
             # Atualizar contexto
             self.context.update_activity()
-            
-            # Salvar a mensagem do usuário no banco de dados
-            save_chat_message(self.user_id, message, "user")
-            
+
             # Executar agente
-            result = await self.agent.run(message, deps=self.context)
-            
-            # Salvar a resposta do bot no banco de dados
+            try:
+                result = await self.agent.run(message, deps=self.context)
+            except Exception:
+                # Sem resposta do bot, a mensagem do usuário ainda vai para o histórico
+                await asyncio.to_thread(self._save_unanswered_message, message)
+                raise
             bot_response = str(result)
-            save_chat_message(self.user_id, bot_response, "bot")
 
-            # Salvar o contexto após cada interação para garantir persistência
-            self.save_context()
+            # Salvar mensagem e resposta numa única transação; o contexto só vai
+            # junto quando mudou ou quando o intervalo de salvamento foi atingido
+            self.turns_since_flush += 1
+            flush_context = not self.context.load_failed and (
+                self.context.is_dirty or self.turns_since_flush >= CONTEXT_FLUSH_INTERVAL
+            )
+            # psycopg2 é bloqueante: gravar numa thread para não travar o event loop
+            saved = await asyncio.to_thread(
+                persist_turn, self.user_id, message, bot_response, self.context if flush_context else None
+            )
+            if saved and flush_context:
+                self.turns_since_flush = 0
 
             return bot_response
 
@@ -136,11 +212,20 @@ class AgentManager:
             print(error_msg)
             return "Desculpe, ocorreu um erro. Tente novamente."
 
+    def _save_unanswered_message(self, message: str):
+        """Grava só a mensagem do usuário, quando o agente falha antes de responder"""
+        from core.persistence import save_chat_message
+        if self.context.is_dirty and not self.context.load_failed:
+            # chat_history referencia user_contexts(user_id)
+            self.save_context()
+        save_chat_message(self.user_id, message, "user")
+
     def save_context(self):
         """Salva o contexto atual no banco de dados"""
         # Importar aqui para evitar circular-import
         from core.persistence import save_context
         save_context(self.user_id, self.context)
+        self.turns_since_flush = 0
 
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas da sessão"""
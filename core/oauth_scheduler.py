@@ -0,0 +1,118 @@
+# 📁 core/oauth_scheduler.py - Renovação antecipada do token OAuth do Google Calendar
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+log = logging.getLogger(__name__)
+
+# Token gravado por config/setup_calendar.py e usado pelas ferramentas de calendário
+TOKEN_FILE = 'data/calendar_token.json'
+
+# Tokens renovados em segundo plano: o do leitor de calendário e o padrão de
+# tools/shared_calendar_auth.py (agendamento e exclusão de eventos)
+TOKEN_FILES = (TOKEN_FILE, 'token.json')
+
+# Renovar o token este tempo antes de expirar
+REFRESH_MARGIN = timedelta(minutes=5)
+
+# Espera antes de tentar novamente após uma falha de renovação (segundos)
+RETRY_DELAY = 60
+
+_refresh_task = None
+
+def _migrate_legacy_token(token_file: str):
+    """
+    Converte o token salvo em pickle por versões anteriores (mesmo nome, extensão
+    .pickle) para JSON. O pickle só é importado quando há um token antigo.
+    """
+    legacy_file = os.path.splitext(token_file)[0] + '.pickle'
+    if os.path.exists(token_file) or not os.path.exists(legacy_file):
+        return
+    import pickle
+    with open(legacy_file, 'rb') as token:
+        creds = pickle.load(token)
+    write_token_atomically(creds, token_file)
+    os.remove(legacy_file)
+
+def read_token(token_file: str = TOKEN_FILE, scopes=None):
+    """
+    Carrega as credenciais salvas em JSON, ou None se o token ainda não existir
+    ou for inválido (ex.: sem refresh_token). Sem `scopes`, valem os escopos
+    gravados no próprio token.
+    """
+    _migrate_legacy_token(token_file)
+    if not os.path.exists(token_file):
+        return None
+    from google.oauth2.credentials import Credentials
+    try:
+        return Credentials.from_authorized_user_file(token_file, scopes)
+    except ValueError as e:
+        # Token incompleto ou corrompido (JSONDecodeError também é ValueError):
+        # tirar do caminho sem apagá-lo, para que as ferramentas refaçam o login
+        invalid_file = token_file + '.invalid'
+        os.replace(token_file, invalid_file)
+        log.warning("Token inválido em %s (%s); movido para %s", token_file, e, invalid_file)
+        return None
+
+def write_token_atomically(creds, token_file: str = TOKEN_FILE):
+    """
+    Grava as credenciais (JSON) em um arquivo temporário e o renomeia sobre o
+    token, para que uma falha no meio da escrita nunca deixe um token corrompido.
+    """
+    directory = os.path.dirname(token_file) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            tmp.write(creds.to_json())
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, token_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+async def _refresh_loop(token_files: tuple):
+    """
+    Dorme até perto da expiração do próximo token, renova e reagenda. A renovação
+    é feita nas credenciais em cache dos serviços de calendário, para que as
+    chamadas seguintes já usem o token novo.
+    """
+    # Importado aqui: o módulo só carrega as bibliotecas do Google no primeiro uso
+    from tools.shared_calendar_auth import refresh_expiring_credentials
+
+    while True:
+        try:
+            delay = await asyncio.to_thread(refresh_expiring_credentials, token_files)
+        except Exception as e:
+            print(f"⚠️  Falha ao renovar o token do Google Calendar: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+
+        if delay is None:
+            # Sem token renovável: o fluxo interativo das ferramentas cuida do login
+            return
+        if delay <= 0:
+            # Renovação falhou ou ainda em andamento em outra thread: tentar mais tarde
+            delay = RETRY_DELAY
+        await asyncio.sleep(delay)
+
+def start_token_refresher(token_files: tuple = TOKEN_FILES):
+    """
+    Inicia (uma única vez) a tarefa de renovação em segundo plano no loop atual.
+    A renovação inline das ferramentas continua valendo como fallback.
+    """
+    global _refresh_task
+    if _refresh_task is not None and not _refresh_task.done():
+        return _refresh_task
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Sem event loop em execução (ex.: uso síncrono): nada a agendar
+        return None
+
+    _refresh_task = loop.create_task(_refresh_loop(token_files))
+    return _refresh_task
@@ -1,48 +1,227 @@
 # 📁 core/persistence.py
+import hashlib
 import json
 import os
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import Json
+from psycopg2.extensions import connection as PgConnection
+from psycopg2.extras import Json, register_default_jsonb
+from psycopg2.pool import ThreadedConnectionPool
+from pydantic_core import from_json, to_json
 from models.context import ConversationContext, SessionData, UserPreferences
 
-# Classe customizada para serializar objetos datetime para JSON
-class DateTimeEncoder(json.JSONEncoder):
+# Pool de conexões compartilhado pelo processo (criado sob demanda no primeiro uso)
+_POOL = None
+
+# Cache em processo do contexto e do histórico recente, por hash do user_id
+_CTX_CACHE: "OrderedDict[bytes, dict]" = OrderedDict()
+_CTX_CACHE_TTL = 60.0
+_CTX_CACHE_MAX_USERS = 256
+# persist_turn roda em threads (asyncio.to_thread): todo acesso ao cache passa por aqui
+_CTX_CACHE_LOCK = threading.Lock()
+
+# Statements do caminho quente, preparados uma única vez por conexão do pool
+_PREPARED_STATEMENTS = {
+    "save_ctx": """
+        PREPARE save_ctx (VARCHAR, JSONB, JSONB, JSONB) AS
+        INSERT INTO user_contexts (user_id, user_preferences, session_data, custom_data)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id) DO UPDATE
+        SET user_preferences = EXCLUDED.user_preferences,
+            session_data = EXCLUDED.session_data,
+            custom_data = EXCLUDED.custom_data,
+            last_updated = CURRENT_TIMESTAMP;
+    """,
+    "load_ctx": """
+        PREPARE load_ctx (VARCHAR) AS
+        SELECT user_preferences, session_data, custom_data FROM user_contexts WHERE user_id = $1;
+    """,
+    "save_msg": """
+        PREPARE save_msg (VARCHAR, TEXT, VARCHAR) AS
+        INSERT INTO chat_history (user_id, message_text, sender) VALUES ($1, $2, $3);
+    """,
+    "save_turn_msgs": """
+        PREPARE save_turn_msgs (VARCHAR, TEXT, TEXT) AS
+        INSERT INTO chat_history (user_id, message_text, sender) VALUES ($1, $2, 'user'), ($1, $3, 'bot');
+    """,
+    "load_history": """
+        PREPARE load_history (VARCHAR, INTEGER) AS
+        SELECT message_text, sender FROM (
+            SELECT id, message_text, sender FROM chat_history
+            WHERE user_id = $1 AND sender IN ('user', 'bot')
+            ORDER BY id DESC LIMIT $2
+        ) recent
+        ORDER BY id;
+    """,
+}
+
+class PreparedConnection(PgConnection):
     """
-    JSON Encoder que lida com objetos datetime.
+    Conexão que lembra se os statements do caminho quente já foram preparados.
     """
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return json.JSONEncoder.default(self, obj)
+    prepared = False
 
-def get_db_connection():
+    def prepare_statements(self):
+        """Executa os PREPARE uma única vez durante a vida da conexão."""
+        if self.prepared:
+            return
+        with self.cursor() as cur:
+            for statement in _PREPARED_STATEMENTS.values():
+                cur.execute(statement)
+        self.commit()
+        self.prepared = True
+
+class FastJson(Json):
+    """
+    Adaptador JSONB do psycopg2 que serializa com o codificador em Rust do
+    pydantic-core (trata datetime nativamente, em ISO 8601).
     """
-    Estabelece e retorna uma conexão com o banco de dados PostgreSQL.
-    As credenciais são lidas de variáveis de ambiente.
+    def dumps(self, obj):
+        return to_json(obj).decode()
+
+def _parse_int(text: str):
+    """Inteiro do JSON; acima do limite de conversão do Python, mantido como texto"""
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+def _loads_jsonb(data):
+    """
+    Decodifica JSONB com o parser do pydantic-core. Ele recusa números que o
+    to_json grava (ex.: inteiros com milhares de dígitos); nesses casos o json
+    da biblioteca padrão lê o documento, para que um valor salvo nunca impeça
+    a leitura do contexto.
     """
     try:
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST', 'localhost'),
-            database=os.getenv('DB_NAME', 'chatbot_db'),
-            user=os.getenv('DB_USER', 'user'),
-            password=os.getenv('DB_PASSWORD', 'password'),
-            port=os.getenv('DB_PORT', '5432')
+        return from_json(data)
+    except ValueError:
+        return json.loads(data, parse_int=_parse_int)
+
+# Decodificar JSONB com _loads_jsonb em todas as conexões
+register_default_jsonb(loads=_loads_jsonb, globally=True)
+
+@lru_cache(maxsize=1)
+def _db_kwargs() -> dict:
+    """
+    Lê uma única vez as credenciais do banco de dados das variáveis de ambiente.
+    A leitura acontece no primeiro uso (não no import) para respeitar o .env
+    criado/carregado pelo setup.py depois de importar este módulo.
+    """
+    return dict(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'chatbot_db'),
+        user=os.getenv('DB_USER', 'user'),
+        password=os.getenv('DB_PASSWORD', 'password'),
+        port=os.getenv('DB_PORT', '5432')
+    )
+
+def _connect():
+    """
+    Abre uma conexão avulsa com o banco de dados PostgreSQL.
+    """
+    return psycopg2.connect(**_db_kwargs())
+
+def _get_pool() -> ThreadedConnectionPool:
+    """
+    Retorna o pool de conexões do processo, criando-o na primeira chamada.
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadedConnectionPool(
+            minconn=1,
+            maxconn=10,
+            connection_factory=PreparedConnection,
+            **_db_kwargs()
         )
-        print("🔗 Conexão com o banco de dados estabelecida com sucesso!")
+        print("🔗 Pool de conexões com o banco de dados criado com sucesso!")
+    return _POOL
+
+def get_db_connection():
+    """
+    Retira uma conexão do pool, com os statements do caminho quente preparados.
+    Deve ser devolvida com put_db_connection().
+    """
+    conn = None
+    try:
+        conn = _get_pool().getconn()
+        conn.prepare_statements()
         return conn
     except Exception as e:
         print(f"❌ Erro ao conectar ao banco de dados: {e}")
+        if conn:
+            _get_pool().putconn(conn, close=True)
         raise
 
+def put_db_connection(conn):
+    """
+    Devolve ao pool uma conexão obtida com get_db_connection().
+    """
+    _get_pool().putconn(conn)
+
+def _cache_key(user_id: str) -> bytes:
+    """
+    Chave de cache de tamanho fixo: user_id pode ser um token longo e opaco.
+    """
+    return hashlib.blake2b(user_id.encode(), digest_size=16).digest()
+
+def _cache_entry(user_id: str, create: bool = False):
+    """
+    Retorna a entrada de cache do usuário (ou None), descartando entradas expiradas.
+    Com create=True, cria uma entrada vazia quando não houver uma válida.
+    Deve ser chamada com _CTX_CACHE_LOCK adquirido.
+    """
+    now = time.monotonic()
+    key = _cache_key(user_id)
+    entry = _CTX_CACHE.get(key)
+    if entry is not None and now - entry["loaded_at"] > _CTX_CACHE_TTL:
+        del _CTX_CACHE[key]
+        entry = None
+    if entry is None:
+        if not create:
+            return None
+        entry = {"context": None, "history": None, "history_limit": 0, "loaded_at": now}
+        _CTX_CACHE[key] = entry
+        if len(_CTX_CACHE) > _CTX_CACHE_MAX_USERS:
+            _CTX_CACHE.popitem(last=False)
+    _CTX_CACHE.move_to_end(key)
+    return entry
+
+def _cache_set(user_id: str, **fields):
+    """
+    Grava campos na entrada de cache do usuário, criando-a se preciso.
+    """
+    with _CTX_CACHE_LOCK:
+        _cache_entry(user_id, create=True).update(fields)
+
+def _cache_append_history(user_id: str, messages: list):
+    """
+    Acrescenta mensagens recém-gravadas ao histórico em cache, se houver um.
+    """
+    with _CTX_CACHE_LOCK:
+        entry = _cache_entry(user_id)
+        if entry is not None and entry["history"] is not None:
+            entry["history"].extend(messages)
+            del entry["history"][:-entry["history_limit"]]
+
+def invalidate(user_id: str):
+    """
+    Remove do cache em processo o contexto e o histórico de um usuário.
+    """
+    with _CTX_CACHE_LOCK:
+        _CTX_CACHE.pop(_cache_key(user_id), None)
+
 def create_tables_if_not_exists():
     """
     Cria as tabelas necessárias no banco de dados se elas ainda não existirem.
     """
     conn = None
     try:
-        conn = get_db_connection()
+        conn = _connect()
         cur = conn.cursor()
         
         # Tabela para armazenar o contexto do usuário
@@ -70,6 +249,21 @@ def create_tables_if_not_exists():
             );
             """
         )
+
+        # Índice para carregar o histórico recente de um usuário sem seq-scan + sort
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_history_user_id_id ON chat_history (user_id, id DESC);"
+        )
+
+        # Linhas antigas gravadas com JSON duplamente codificado (uma string JSON
+        # dentro do JSONB) são convertidas uma vez para o objeto correspondente
+        for column in ("user_preferences", "session_data", "custom_data"):
+            cur.execute(
+                sql.SQL(
+                    "UPDATE user_contexts SET {col} = ({col} #>> '{{}}')::jsonb "
+                    "WHERE jsonb_typeof({col}) = 'string';"
+                ).format(col=sql.Identifier(column))
+            )
         
         conn.commit()
         print("✅ Tabelas verificadas/criadas com sucesso.")
@@ -81,87 +275,92 @@ def create_tables_if_not_exists():
         if conn:
             conn.close()
 
+def _context_params(user_id: str, context: ConversationContext) -> tuple:
+    """
+    Serializa o contexto nos parâmetros do statement preparado save_ctx.
+    """
+    return (
+        user_id,
+        FastJson(context.user_preferences.model_dump()),
+        FastJson(context.session_data.model_dump()),
+        FastJson(context.custom_data.to_dict())
+    )
+
 def save_context(user_id: str, context: ConversationContext):
     """
     Salva o estado atual do ConversationContext para um user_id específico no PostgreSQL.
     """
+    if context.load_failed:
+        print(f"⚠️  Contexto do usuário '{user_id}' não foi carregado do banco; não será salvo.")
+        return
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-
-        user_preferences_json = json.dumps(context.user_preferences.model_dump(), cls=DateTimeEncoder)
-        session_data_json = json.dumps(context.session_data.model_dump(), cls=DateTimeEncoder)
-        custom_data_json = json.dumps(context.custom_data, cls=DateTimeEncoder)
-        
-        cur.execute(
-            """
-            INSERT INTO user_contexts (user_id, user_preferences, session_data, custom_data)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (user_id) DO UPDATE
-            SET user_preferences = EXCLUDED.user_preferences,
-                session_data = EXCLUDED.session_data,
-                custom_data = EXCLUDED.custom_data,
-                last_updated = CURRENT_TIMESTAMP;
-            """,
-            (user_id, Json(user_preferences_json), Json(session_data_json), Json(custom_data_json))
-        )
-        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE save_ctx (%s, %s, %s, %s);", _context_params(user_id, context))
+            conn.commit()
         print(f"💾 Contexto do usuário '{user_id}' salvo com sucesso.")
     except Exception as e:
         print(f"❌ Erro ao salvar contexto do usuário '{user_id}': {e}")
         if conn:
             conn.rollback()
+        return
     finally:
         if conn:
-            conn.close()
+            put_db_connection(conn)
+
+    context.mark_clean()
+    _cache_set(user_id, context=context)
 
 def load_context(user_id: str) -> ConversationContext:
     """
     Carrega o ConversationContext para um user_id específico do PostgreSQL.
-    Retorna um novo ConversationContext se não encontrar dados.
+    Retorna um novo ConversationContext se não encontrar dados. Se a leitura
+    falhar, o contexto retornado é marcado para nunca ser salvo, para não
+    sobrescrever os dados do usuário no banco.
     """
+    with _CTX_CACHE_LOCK:
+        entry = _cache_entry(user_id)
+        cached = entry["context"] if entry is not None else None
+    if cached is not None:
+        return cached
+
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "SELECT user_preferences, session_data, custom_data FROM user_contexts WHERE user_id = %s;",
-            (user_id,)
-        )
-        record = cur.fetchone()
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE load_ctx (%s);", (user_id,))
+            record = cur.fetchone()
         
-        if record:
-            user_preferences_data, session_data_data, custom_data = record
-            print(f"🔄 Contexto do usuário '{user_id}' carregado com sucesso.")
-
-            if isinstance(user_preferences_data, str):
-                user_preferences_data = json.loads(user_preferences_data)
-            if isinstance(session_data_data, str):
-                session_data_data = json.loads(session_data_data)
-            if isinstance(custom_data, str):
-                custom_data = json.loads(custom_data)
-
-            user_preferences = UserPreferences(**user_preferences_data)
-            session_data = SessionData(**session_data_data)
+            if record:
+                user_preferences_data, session_data_data, custom_data = record
+                print(f"🔄 Contexto do usuário '{user_id}' carregado com sucesso.")
+
+                user_preferences = UserPreferences(**user_preferences_data)
+                session_data = SessionData(**session_data_data)
             
-            context = ConversationContext(
-                user_id=user_id,
-                user_preferences=user_preferences,
-                session_data=session_data,
-                custom_data=custom_data
-            )
-            return context
-        else:
-            print(f"🆕 Nenhum contexto encontrado para o usuário '{user_id}'. Criando novo.")
-            return ConversationContext(user_id=user_id)
+                context = ConversationContext(
+                    user_id=user_id,
+                    user_preferences=user_preferences,
+                    session_data=session_data,
+                    custom_data=custom_data
+                )
+            else:
+                print(f"🆕 Nenhum contexto encontrado para o usuário '{user_id}'. Criando novo.")
+                context = ConversationContext(user_id=user_id)
+                # Contexto novo precisa ser gravado: chat_history referencia user_contexts
+                context.mark_dirty()
+        _cache_set(user_id, context=context)
+        return context
     except Exception as e:
         print(f"❌ Erro ao carregar contexto do usuário '{user_id}': {e}")
-        return ConversationContext(user_id=user_id) 
+        print("⚠️  Usando um contexto temporário; ele não será salvo nesta sessão.")
+        context = ConversationContext(user_id=user_id)
+        context.mark_load_failed()
+        return context
     finally:
         if conn:
-            conn.close()
+            put_db_connection(conn)
 
 def save_chat_message(user_id: str, message: str, sender: str):
     """
@@ -170,40 +369,80 @@ def save_chat_message(user_id: str, message: str, sender: str):
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO chat_history (user_id, message_text, sender) VALUES (%s, %s, %s);",
-            (user_id, message, sender)
-        )
-        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE save_msg (%s, %s, %s);", (user_id, message, sender))
+            conn.commit()
     except Exception as e:
         print(f"❌ Erro ao salvar mensagem no histórico: {e}")
         if conn:
             conn.rollback()
+        return
     finally:
         if conn:
-            conn.close()
+            put_db_connection(conn)
+
+    if sender in ('user', 'bot'):
+        _cache_append_history(user_id, [{"sender": sender, "message_text": message}])
 
 def load_chat_history(user_id: str, limit: int = 10) -> list:
     """
-    Carrega as últimas N mensagens de conversa do banco de dados para um usuário.
+    Carrega as últimas N mensagens de usuário/bot do banco de dados, em ordem cronológica.
     """
+    with _CTX_CACHE_LOCK:
+        entry = _cache_entry(user_id)
+        if entry is not None and entry["history"] is not None and entry["history_limit"] >= limit:
+            return entry["history"][-limit:]
+
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT message_text, sender FROM chat_history WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s;",
-            (user_id, limit)
-        )
-        messages = cur.fetchall()
-        
-        # O resultado vem em ordem decrescente, então inverta para que a conversa seja cronológica
-        history = [{"sender": row[1], "message_text": row[0]} for row in reversed(messages)]
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE load_history (%s, %s);", (user_id, limit))
+            # O banco já devolve apenas mensagens de usuário/bot, em ordem cronológica
+            history = [{"sender": sender, "message_text": text} for text, sender in cur.fetchall()]
+        _cache_set(user_id, history=list(history), history_limit=limit)
         return history
     except Exception as e:
         print(f"❌ Erro ao carregar histórico de conversa: {e}")
         return []
     finally:
         if conn:
-            conn.close()
+            put_db_connection(conn)
+
+def persist_turn(user_id: str, user_message: str, bot_message: str, context: ConversationContext = None) -> bool:
+    """
+    Persiste um turno completo (mensagem do usuário, resposta do bot e, se
+    informado, o contexto) em uma única transação, usando uma só conexão do pool.
+    Retorna True se o turno foi gravado.
+    """
+    if context is not None and context.load_failed:
+        # Contexto temporário (falha na leitura): gravar só as mensagens
+        context = None
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            # O contexto vem primeiro: chat_history referencia user_contexts(user_id)
+            if context is not None:
+                cur.execute("EXECUTE save_ctx (%s, %s, %s, %s);", _context_params(user_id, context))
+            cur.execute("EXECUTE save_turn_msgs (%s, %s, %s);", (user_id, user_message, bot_message))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Erro ao salvar o turno do usuário '{user_id}': {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            put_db_connection(conn)
+
+    # Turno já gravado: o cache é atualizado fora do try, para que um erro aqui
+    # não seja reportado como turno perdido
+    if context is not None:
+        context.mark_clean()
+        _cache_set(user_id, context=context)
+    _cache_append_history(user_id, [
+        {"sender": "user", "message_text": user_message},
+        {"sender": "bot", "message_text": bot_message}
+    ])
+    return True
@@ -1,77 +1,288 @@
 # 📁 core/tool_registry.py
-from typing import Dict, Callable, List, Any
+from typing import Dict, Callable, List, Any, Iterable, Mapping, Optional
+from types import MappingProxyType
+from dataclasses import dataclass
 from pydantic_ai import Agent
+from functools import lru_cache, partial
+import ast
 import importlib
+import importlib.util
+import logging
 import os
-import inspect
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Mensagens de registro/anexação em INFO: sem custo de formatação no nível padrão (WARNING)
+log = logging.getLogger(__name__)
+
+@dataclass(slots=True, frozen=True)
+class ToolInfo:
+    """Descrição de uma ferramenta retornada por list_tools()"""
+    function: str
+    doc: str
+    metadata: Dict[str, Any]
+
+def _import_tool_module(module_name: str, path: str = None):
+    """
+    Importa um módulo de ferramenta. Com o caminho do arquivo (já conhecido
+    pela varredura do diretório), carrega direto pelo spec, sem percorrer os
+    finders de sys.meta_path/sys.path.
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    if path is None:
+        return importlib.import_module(module_name)
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+@lru_cache(maxsize=None)
+def _load_tool(module_name: str, func_name: str, path: str = None) -> Callable:
+    """Importa o módulo da ferramenta (uma única vez) e retorna a função"""
+    return getattr(_import_tool_module(module_name, path), func_name)
+
+def _import_modules_in_parallel(modules: Iterable[tuple]):
+    """
+    Importa em threads os módulos (nome, caminho) ainda não carregados. Os
+    módulos de ferramentas são independentes (não importam uns aos outros) e
+    o import tem uma parte de I/O (ler o código-fonte/bytecode) que pode se
+    sobrepor; cada módulo é atribuído a uma única thread.
+    """
+    pending = sorted({(name, path) for name, path in modules if name not in sys.modules})
+    if len(pending) < 2:
+        return
+    with ThreadPoolExecutor(max_workers=min(8, len(pending))) as executor:
+        futures = [executor.submit(_import_tool_module, name, path) for name, path in pending]
+    for future in futures:
+        # Erros são informados depois, no carregamento de cada ferramenta
+        future.exception()
+
+def _literal_metadata(value: ast.expr, functions: Dict[str, ast.AST]) -> Optional[Dict[str, Any]]:
+    """
+    Extrai os metadados sem executar o módulo: aceita um dict literal ou a
+    chamada de uma função do próprio módulo que retorna um dict literal.
+    Retorna None quando os metadados só podem ser obtidos importando o módulo.
+    """
+    if isinstance(value, ast.Call):
+        if (not isinstance(value.func, ast.Name) or value.args or value.keywords
+                or value.func.id not in functions):
+            return None
+        returns = [
+            node for node in ast.walk(functions[value.func.id])
+            if isinstance(node, ast.Return) and node.value is not None
+        ]
+        if len(returns) != 1:
+            return None
+        value = returns[0].value
+    try:
+        metadata = ast.literal_eval(value)
+    except ValueError:
+        return None
+    return metadata if isinstance(metadata, dict) else None
+
+def _index_tool_source(source: bytes) -> List[tuple]:
+    """
+    Lista as ferramentas de um arquivo a partir da sua AST, sem importá-lo.
+    Cada item é (nome da função, metadados ou None, docstring).
+    """
+    tree = ast.parse(source)
+    functions = {
+        node.name: node for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+
+    entries = []
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            # Procura atribuições do tipo `funcao.__tool_metadata__ = ...`
+            if (isinstance(target, ast.Attribute) and target.attr == '__tool_metadata__'
+                    and isinstance(target.value, ast.Name) and target.value.id in functions):
+                func_name = target.value.id
+                entries.append((
+                    func_name,
+                    _literal_metadata(node.value, functions),
+                    ast.get_docstring(functions[func_name], clean=False)
+                ))
+    return entries
+
+@lru_cache(maxsize=512)
+def _index_tool_file(path: str, mtime_ns: int, size: int) -> tuple:
+    """
+    Indexa um arquivo de ferramentas; (mtime, tamanho) fazem parte da chave do
+    cache, então arquivos inalterados não são lidos nem analisados de novo.
+    Retorna (entradas, precisa_importar): o segundo item indica marcações de
+    ferramenta que a AST não reconhece.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+    entries = tuple(_index_tool_source(source))
+    return entries, not entries and b'__tool_metadata__' in source
+
 class ToolRegistry:
     """Registry para gerenciar ferramentas dinamicamente"""
-    
+
     def __init__(self):
         self.tools: Dict[str, Callable] = {}
         self.tool_metadata: Dict[str, Dict[str, Any]] = {}
-    
+        # Ferramentas descobertas e ainda não importadas: nome -> (módulo, função, docstring, caminho)
+        self._lazy_tools: Dict[str, tuple] = {}
+        # Resultado da descoberta por (diretório, mtime do diretório)
+        self._discovery_cache: Dict[tuple, List[str]] = {}
+        # Resultado de list_tools(), refeito apenas quando o registro muda
+        self._list_cache: Optional[Mapping[str, ToolInfo]] = None
+
     def register_tool(self, name: str, func: Callable, metadata: Dict[str, Any] = None):
         """Registra uma ferramenta manualmente"""
         self.tools[name] = func
         self.tool_metadata[name] = metadata or {}
-        print(f"🔧 Ferramenta registrada: {name}")
-    
+        self._lazy_tools.pop(name, None)
+        self._list_cache = None
+        log.info("Ferramenta registrada: %s", name)
+
+    def register_lazy_tool(self, name: str, module_name: str, metadata: Dict[str, Any] = None,
+                           doc: str = None, path: str = None):
+        """Registra uma ferramenta cujo módulo só será importado quando ela for usada"""
+        self.tools[name] = partial(_load_tool, module_name, name, path)
+        # Cópia: o dict de metadados pode vir do cache de _index_tool_file
+        self.tool_metadata[name] = dict(metadata or {})
+        self._lazy_tools[name] = (module_name, name, doc, path)
+        self._list_cache = None
+        log.info("Ferramenta registrada: %s", name)
+
+    def get_tool(self, name: str) -> Callable:
+        """Retorna a função da ferramenta, importando o módulo se necessário"""
+        if name in self._lazy_tools:
+            self.tools[name] = self.tools[name]()
+            del self._lazy_tools[name]
+            self._list_cache = None
+        return self.tools[name]
+
     def auto_discover_tools(self, tools_directory: str = "tools") -> List[str]:
-        """Descobre e carrega ferramentas automaticamente"""
+        """Descobre ferramentas automaticamente, sem importar os módulos"""
         discovered = []
         tools_path = Path(tools_directory)
-        
+
         if not tools_path.exists():
-            print(f"⚠️  Diretório {tools_directory} não encontrado")
+            log.warning("Diretório %s não encontrado", tools_directory)
             return discovered
-        
-        # Buscar arquivos Python no diretório
-        for file_path in tools_path.glob("*.py"):
-            if file_path.name.startswith("__"):
-                continue
-                
-            module_name = f"{tools_directory}.{file_path.stem}"
+
+        # Se o diretório não mudou desde a última varredura, reaproveitar o resultado
+        cache_key = (tools_directory, os.stat(tools_path).st_mtime_ns)
+        if cache_key in self._discovery_cache:
+            return list(self._discovery_cache[cache_key])
+
+        # Buscar arquivos Python no diretório (os.scandir já informa o tipo de
+        # cada entrada, sem um stat extra por arquivo)
+        with os.scandir(tools_path) as it:
+            tool_files = [
+                entry for entry in it
+                if entry.name.endswith('.py') and not entry.name.startswith('__')
+                and entry.is_file(follow_symlinks=False)
+            ]
+
+        for dir_entry in tool_files:
+            module_name = f"{tools_directory}.{dir_entry.name[:-3]}"
             try:
-                # Importar módulo
-                module = importlib.import_module(module_name)
-                
-                # Buscar funções que são ferramentas
-                for name, obj in inspect.getmembers(module):
-                    if (inspect.isfunction(obj) and 
-                        hasattr(obj, '__tool_metadata__')):
-                        
-                        self.register_tool(
-                            name, 
-                            obj, 
-                            getattr(obj, '__tool_metadata__', {})
-                        )
+                # Indexar as ferramentas pela AST; o import fica para o primeiro uso
+                stat = dir_entry.stat()
+                entries, needs_import = _index_tool_file(dir_entry.path, stat.st_mtime_ns, stat.st_size)
+                for name, metadata, doc in entries:
+                    if metadata is None:
+                        # Metadados dinâmicos: só importando o módulo
+                        metadata = getattr(_load_tool(module_name, name, dir_entry.path), '__tool_metadata__', {})
+                    self.register_lazy_tool(name, module_name, metadata, doc, dir_entry.path)
+                    discovered.append(name)
+
+                if needs_import:
+                    # Marcação que a AST não reconhece: importar e percorrer o
+                    # dicionário do módulo (sem a ordenação/getattr do inspect.getmembers)
+                    module = _import_tool_module(module_name, dir_entry.path)
+                    for name, obj in vars(module).items():
+                        # O atributo é o contrato de registro: filtrar por ele primeiro
+                        metadata = getattr(obj, '__tool_metadata__', None)
+                        if metadata is None or not callable(obj):
+                            continue
+                        self.register_tool(name, obj, metadata)
                         discovered.append(name)
-                        
-            except ImportError as e:
-                print(f"❌ Erro ao carregar {module_name}: {e}")
-        
+
+            except (ImportError, SyntaxError, OSError) as e:
+                log.error("Erro ao carregar %s: %s", module_name, e)
+
+        self._discovery_cache[cache_key] = list(discovered)
         return discovered
-    
-    def attach_tools_to_agent(self, agent: Agent):
-        """Anexa todas as ferramentas registradas ao agente"""
-        for name, tool_func in self.tools.items():
-            # O decorador @agent.tool é aplicado dinamicamente
+
+    def enabled_tool_names(self, enabled: Iterable[str]) -> List[str]:
+        """
+        Converte os nomes da configuração (campo "name" dos metadados, ou o
+        próprio nome da função) nas chaves do registry.
+        """
+        enabled = set(enabled)
+        names = []
+        found = set()
+        for name in self.tools:
+            config_name = self.tool_metadata.get(name, {}).get('name', name)
+            if config_name in enabled or name in enabled:
+                names.append(name)
+                found.update((config_name, name))
+        for missing in enabled - found:
+            log.warning("Ferramenta habilitada %s não encontrada", missing)
+        return names
+
+    def attach_tools_to_agent(self, agent: Agent, names: Iterable[str] = None):
+        """
+        Anexa as ferramentas registradas ao agente (todas, ou apenas `names`).
+        Só os módulos das ferramentas anexadas são importados.
+        """
+        names = list(self.tools if names is None else names)
+        _import_modules_in_parallel(
+            (self._lazy_tools[name][0], self._lazy_tools[name][3])
+            for name in names if name in self._lazy_tools
+        )
+
+        attached = {}
+        for name in names:
+            if name not in self.tools:
+                log.warning("Ferramenta %s não encontrada", name)
+                continue
+            try:
+                attached[name] = self.get_tool(name)
+            except ImportError as e:
+                log.error("Erro ao carregar a ferramenta %s: %s", name, e)
+
+        # O decorador @agent.tool é aplicado dinamicamente
+        for tool_func in attached.values():
             agent.tool(tool_func)
-            print(f"✅ Ferramenta {name} anexada ao agente")
-    
-    def list_tools(self) -> Dict[str, Dict[str, Any]]:
-        """Lista todas as ferramentas disponíveis"""
-        return {
-            name: {
-                "function": func.__name__,
-                "doc": func.__doc__ or "Sem descrição",
-                "metadata": self.tool_metadata.get(name, {})
-            }
-            for name, func in self.tools.items()
-        }
+        log.info("%d ferramentas anexadas ao agente: %s", len(attached), list(attached))
+
+    def list_tools(self) -> Mapping[str, ToolInfo]:
+        """Lista todas as ferramentas disponíveis (somente leitura)"""
+        if self._list_cache is not None:
+            return self._list_cache
+
+        tools = {}
+        for name, func in self.tools.items():
+            if name in self._lazy_tools:
+                _, function_name, doc, _ = self._lazy_tools[name]
+            else:
+                function_name, doc = func.__name__, func.__doc__
+            tools[name] = ToolInfo(
+                function=function_name,
+                doc=doc or "Sem descrição",
+                metadata=self.tool_metadata.get(name, {})
+            )
+        self._list_cache = MappingProxyType(tools)
+        return self._list_cache
 
 # Instância global do registry
 tool_registry = ToolRegistry()
@@ -1,9 +1,46 @@
 # 📁 main.py - Aplicação Principal com Memória de Longo Prazo
 import asyncio
-from core.agent_manager import AgentManager
-from core.tool_registry import tool_registry
+import sys
 import os
-from core.persistence import create_tables_if_not_exists # Importar a função de criação de tabelas
+
+def handle_exit(manager, tools_list) -> bool:
+    """Comando 'sair': mostra estatísticas, salva o contexto e encerra"""
+    stats = manager.get_stats()
+    print(f"\n📊 Estatísticas da sessão:")
+    for key, value in stats.items():
+        print(f"   • {key}: {value}")
+    
+    # Salvar o contexto antes de sair
+    manager.save_context() 
+    print("👋 Obrigado por usar o ChatBot! Contexto salvo.")
+    return True
+
+def handle_stats(manager, tools_list) -> bool:
+    """Comando 'stats': mostra estatísticas da sessão"""
+    stats = manager.get_stats()
+    print(f"\n📊 Estatísticas:")
+    for key, value in stats.items():
+        print(f"   • {key}: {value}")
+    return False
+
+def handle_tools(manager, tools_list) -> bool:
+    """Comando 'tools': lista as ferramentas (as mesmas durante toda a sessão)"""
+    sys.stdout.write(
+        f"\n🔧 Ferramentas ({len(tools_list)}):\n"
+        + "".join(f"   • {name}: {info.doc}\n" for name, info in tools_list.items())
+    )
+    sys.stdout.flush()
+    return False
+
+# Comandos do loop principal; o handler retorna True para encerrar
+COMMANDS = {
+    'sair': handle_exit,
+    'stats': handle_stats,
+    'tools': handle_tools,
+}
+
+# Entradas maiores que o comando mais longo vão direto ao agente, sem lower()
+_MAX_COMMAND_LEN = max(map(len, COMMANDS))
 
 async def main():
     """Aplicação principal do chatbot modular"""
@@ -11,8 +48,13 @@ async def main():
     print("🚀 ChatBot Modular com Memória de Longo Prazo")
     print("="*50)
     
+    # Importados só depois do banner: trazem pydantic_ai/openai, que demoram a carregar
+    from core.agent_manager import get_agent_manager
+    from core.tool_registry import tool_registry
+    
     # === AQUI VEM A ALTERAÇÃO ===
     # Garante que as tabelas existem antes de tentar usar o banco de dados
+    from core.persistence import create_tables_if_not_exists
     create_tables_if_not_exists()
     
     # Em uma aplicação real, você obteria o user_id de um sistema de autenticação.
@@ -23,13 +65,15 @@ async def main():
     
     try:
         # Inicializar gerenciador do agente
-        manager = AgentManager(user_id=user_id)
+        manager = await get_agent_manager(user_id)
         
-        # Mostrar ferramentas disponíveis
+        # Mostrar ferramentas disponíveis (lista reaproveitada pelo comando 'tools')
         tools_list = tool_registry.list_tools()
-        print("\n🛠️  Ferramentas Disponíveis:")
-        for name, info in tools_list.items():
-            print(f"   • {name}: {info['doc'][:50]}...")
+        sys.stdout.write(
+            "\n🛠️  Ferramentas Disponíveis:\n"
+            + "".join(f"   • {name}: {info.doc[:50]}...\n" for name, info in tools_list.items())
+        )
+        sys.stdout.flush()
         
         print("\n" + "="*50)
         print("Digite 'sair' para encerrar")
@@ -49,29 +93,10 @@ async def main():
             if not user_input:
                 continue
             
-            if user_input.lower() == 'sair':
-                stats = manager.get_stats()
-                print(f"\n📊 Estatísticas da sessão:")
-                for key, value in stats.items():
-                    print(f"   • {key}: {value}")
-                
-                # Salvar o contexto antes de sair
-                manager.save_context() 
-                print("👋 Obrigado por usar o ChatBot! Contexto salvo.")
-                break
-                
-            elif user_input.lower() == 'stats':
-                stats = manager.get_stats()
-                print(f"\n📊 Estatísticas:")
-                for key, value in stats.items():
-                    print(f"   • {key}: {value}")
-                continue
-                
-            elif user_input.lower() == 'tools':
-                tools_list = tool_registry.list_tools()
-                print(f"\n🔧 Ferramentas ({len(tools_list)}):")
-                for name, info in tools_list.items():
-                    print(f"   • {name}: {info['doc']}")
+            handler = COMMANDS.get(user_input.lower()) if len(user_input) <= _MAX_COMMAND_LEN else None
+            if handler:
+                if handler(manager, tools_list):
+                    break
                 continue
             
             # Processar mensagem
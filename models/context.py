@@ -1,37 +1,144 @@
 # ========================
 # 📁 models/context.py
-from pydantic import BaseModel, Field
-from typing import Dict, Any, List
+# Os modelos são mutáveis e não revalidam atribuições: update_activity roda a cada mensagem
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, model_validator
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+import time
 
 class UserPreferences(BaseModel):
     """Preferências do usuário"""
+    model_config = ConfigDict(validate_assignment=False, arbitrary_types_allowed=False, frozen=False)
+
     language: str = Field(default="pt-BR")
     timezone: str = Field(default="America/Sao_Paulo")
     notification_enabled: bool = Field(default=True)
-    preferred_units: Dict[str, str] = Field(default_factory=lambda: {
-        "temperature": "celsius",
-        "distance": "km",
-        "weight": "kg"
-    })
+    # None = unidades padrão (celsius, km, kg); nenhum dict é criado por instância
+    preferred_units: Optional[Dict[str, str]] = Field(default=None)
 
 class SessionData(BaseModel):
     """Dados da sessão"""
-    session_id: str = Field(default_factory=lambda: str(datetime.now().timestamp()))
+    model_config = ConfigDict(validate_assignment=False, arbitrary_types_allowed=False, frozen=False)
+
+    session_id: str = Field(default_factory=lambda: format(time.time_ns(), 'x'))
     start_time: datetime = Field(default_factory=datetime.now)
     message_count: int = Field(default=0)
-    last_activity: datetime = Field(default_factory=datetime.now)
+    # Epoch em nanossegundos: atualizado a cada mensagem sem criar um datetime
+    last_activity_ns: int = Field(default_factory=time.time_ns)
+
+    @model_validator(mode='before')
+    @classmethod
+    def convert_legacy_last_activity(cls, data: Any) -> Any:
+        """Converte o campo `last_activity` (ISO 8601) de sessões salvas antes"""
+        if isinstance(data, dict) and 'last_activity' in data and 'last_activity_ns' not in data:
+            data = dict(data)
+            value = data.pop('last_activity')
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            if isinstance(value, datetime):
+                data['last_activity_ns'] = int(value.timestamp() * 1_000_000_000)
+        return data
+
+    @property
+    def last_activity(self) -> datetime:
+        """Última atividade como datetime local"""
+        return datetime.fromtimestamp(self.last_activity_ns / 1_000_000_000)
+
+class HotCustomData(BaseModel):
+    """Dados customizados do usuário
+    
+    As chaves mais usadas pelas ferramentas são campos declarados (None = não
+    definido); as demais ficam como extras. Serializado, continua sendo um
+    objeto JSON plano, compatível com o formato salvo antes.
+    """
+    model_config = ConfigDict(extra='allow', validate_assignment=False)
+
+    user_name: Optional[str] = None
+    tasks: Optional[Dict[str, Any]] = None
+    calc_history: Optional[List[Any]] = None
+    conversion_history: Optional[List[Any]] = None
+    password_stats: Optional[Dict[str, Any]] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Recupera uma chave, declarada ou extra"""
+        if key in _HOT_KEYS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.__pydantic_extra__.get(key, default)
+
+    def set(self, key: str, value: Any):
+        """Define uma chave, declarada ou extra"""
+        if key in _HOT_KEYS:
+            setattr(self, key, value)
+        else:
+            self.__pydantic_extra__[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Objeto plano com as chaves definidas, para persistência"""
+        data = {key: getattr(self, key) for key in _HOT_KEYS if getattr(self, key) is not None}
+        data.update(self.__pydantic_extra__)
+        return data
+
+    def keys(self) -> List[str]:
+        """Chaves definidas"""
+        return list(self.to_dict())
+
+_HOT_KEYS = tuple(HotCustomData.model_fields)
 
 class ConversationContext(BaseModel):
     """Contexto completo da conversa"""
+    model_config = ConfigDict(validate_assignment=False, arbitrary_types_allowed=False, frozen=False)
+
     user_id: str = Field(default="anonymous")
     user_preferences: UserPreferences = Field(default_factory=UserPreferences)
     session_data: SessionData = Field(default_factory=SessionData)
-    custom_data: Dict[str, Any] = Field(default_factory=dict)
+    custom_data: HotCustomData = Field(default_factory=HotCustomData)
+
+    # Indica mudanças em preferências/dados customizados ainda não persistidas
+    _dirty: bool = PrivateAttr(default=False)
+    # O contexto não pôde ser lido do banco: é temporário e nunca deve ser salvo
+    _load_failed: bool = PrivateAttr(default=False)
+    # Histórico recente usado no prompt do sistema (não é salvo junto com o contexto)
+    _chat_history: List[Dict[str, str]] = PrivateAttr(default_factory=list)
+    
+    @property
+    def chat_history(self) -> List[Dict[str, str]]:
+        """Histórico de conversa carregado para este usuário"""
+        return self._chat_history
+    
+    def set_chat_history(self, history: List[Dict[str, str]]):
+        """Define o histórico usado no prompt do sistema"""
+        self._chat_history = history
+    
+    @property
+    def is_dirty(self) -> bool:
+        """Há alterações relevantes ainda não salvas no banco"""
+        return self._dirty
+    
+    def mark_dirty(self):
+        """Marca o contexto para ser salvo no próximo turno"""
+        self._dirty = True
+    
+    def mark_clean(self):
+        """Marca o contexto como salvo"""
+        self._dirty = False
+    
+    @property
+    def load_failed(self) -> bool:
+        """A leitura do banco falhou: salvar este contexto apagaria os dados do usuário"""
+        return self._load_failed
+    
+    def mark_load_failed(self):
+        """Marca o contexto como temporário, para que nunca seja salvo"""
+        self._load_failed = True
     
     def update_activity(self):
-        """Atualiza última atividade e incrementa contador"""
-        self.session_data.last_activity = datetime.now()
+        """Atualiza última atividade e incrementa contador
+        
+        Não marca o contexto como sujo: os contadores de sessão são salvos
+        periodicamente e no encerramento, não a cada mensagem.
+        """
+        self.session_data.last_activity_ns = time.time_ns()
         self.session_data.message_count += 1
     
     def get_user_data(self, key: str, default: Any = None) -> Any:
@@ -40,6 +147,7 @@ class ConversationContext(BaseModel):
     
     def set_user_data(self, key: str, value: Any):
         """Salva dados customizados do usuário"""
-        self.custom_data[key] = value
+        self.custom_data.set(key, value)
+        self._dirty = True
 
 # ========================
@@ -1,10 +1,12 @@
 # 📁 setup.py - Script de configuração inicial
+import asyncio
 import os
 import sys
 from pathlib import Path
 import json
 import subprocess # Importar para executar comandos externos
-from dotenv import load_dotenv, set_key
+from functools import lru_cache
+from dotenv import dotenv_values
 
 # Adicionar diretório raiz ao sys.path para importações relativas
 sys.path.append(str(Path(__file__).parent))
@@ -17,6 +19,43 @@ except ImportError:
     print("⚠️ Módulo persistence não encontrado, a criação de tabelas não será executada.")
     create_tables_if_not_exists = None
 
+@lru_cache(maxsize=1)
+def _env(path: str = '.env') -> dict:
+    """Conteúdo do .env, lido uma única vez por processo (invalidado ao escrevê-lo)"""
+    return dotenv_values(path) if os.path.exists(path) else {}
+
+def _setting(key: str, default: str) -> str:
+    """Variável de ambiente, depois o .env, depois o padrão (mesma precedência do load_dotenv)"""
+    return os.environ.get(key, _env().get(key) or default)
+
+# Variáveis padrão adicionadas ao .env quando ainda não existirem
+ENV_DEFAULTS = {
+    "OPENAI_API_KEY": "your_openai_api_key_here",
+    "AGENT_MODEL": "openai:gpt-3.5-turbo",
+    "AGENT_TEMPERATURE": "0.7",
+    "AGENT_MAX_TOKENS": "300",
+    "LOG_LEVEL": "INFO",
+    "LOG_FILE": "logs/chatbot.log",
+    "TOOLS_AUTO_DISCOVERY": "true",
+    "TOOLS_DIRECTORY": "tools",
+    # Novas variáveis para o PostgreSQL
+    "DB_HOST": "localhost",
+    "DB_NAME": "chatbot_db",
+    "DB_USER": "chatbot_user",
+    "DB_PASSWORD": "password",
+    "DB_PORT": "5432"
+}
+
+# Templates dos arquivos gerados pelo setup (copiados byte a byte)
+TEMPLATES_DIR = Path(__file__).parent / "setup_templates"
+
+# Arquivos gerados pelo setup: caminho -> (template, sobrescrever se existir, mensagem)
+PROJECT_FILES = {
+    "requirements.txt": ("requirements.txt", True, "📋 requirements.txt atualizado"),
+    ".gitignore": ("gitignore.txt", False, "🚫 .gitignore criado"),
+    "README.md": ("README.md", True, "📖 README.md criado"),
+}
+
 def create_directory_structure():
     """Cria estrutura de diretórios do projeto"""
     
@@ -32,292 +71,84 @@ def create_directory_structure():
     
     print("🏗️ Criando estrutura de diretórios...")
     
+    created = set()
     for dir_name in directories:
-        Path(dir_name).mkdir(exist_ok=True)
+        if not os.path.isdir(dir_name):
+            os.mkdir(dir_name)
+            created.add(dir_name)
         print(f"   📁 {dir_name}/")
-        
-        # Criar __init__.py para tornar diretórios em pacotes Python
-        if dir_name not in ['logs', 'data']:
-            init_file = Path(dir_name) / "__init__.py"
-            if not init_file.exists():
-                init_file.write_text("# -*- coding: utf-8 -*-\n")
+    
+    # Criar __init__.py vazios para tornar diretórios em pacotes Python (o UTF-8
+    # já é o padrão no Python 3; em diretório recém-criado não há o que verificar)
+    for dir_name in directories:
+        if dir_name in ('logs', 'data'):
+            continue
+        init_file = Path(dir_name, "__init__.py")
+        if dir_name in created or not init_file.exists():
+            init_file.touch()
     
     print("✅ Estrutura criada com sucesso!")
 
 def create_env_file():
     """Cria arquivo .env se não existir e adiciona variáveis padrão."""
     env_file = Path(".env")
+    existed = env_file.exists()
     
-    # Carrega o .env existente para não apagar variáveis já configuradas
-    load_dotenv(dotenv_path=env_file)
-
-    initial_env_content = {
-        "OPENAI_API_KEY": "your_openai_api_key_here",
-        "AGENT_MODEL": "openai:gpt-3.5-turbo",
-        "AGENT_TEMPERATURE": "0.7",
-        "AGENT_MAX_TOKENS": "300",
-        "LOG_LEVEL": "INFO",
-        "LOG_FILE": "logs/chatbot.log",
-        "TOOLS_AUTO_DISCOVERY": "true",
-        "TOOLS_DIRECTORY": "tools",
-        # Novas variáveis para o PostgreSQL
-        "DB_HOST": "localhost",
-        "DB_NAME": "chatbot_db",
-        "DB_USER": "chatbot_user",
-        "DB_PASSWORD": "password",
-        "DB_PORT": "5432"
+    # Lê o .env existente uma vez, para não sobrescrever variáveis já configuradas
+    existing = _env(str(env_file))
+    missing = {
+        key: value for key, value in ENV_DEFAULTS.items()
+        if key not in existing and os.getenv(key) is None
     }
 
-    # Adiciona variáveis ao .env se não existirem
-    updated = False
-    for key, value in initial_env_content.items():
-        if os.getenv(key) is None:
-            set_key(env_file, key, value)
-            updated = True
+    # Adiciona as variáveis que faltam numa única escrita
+    if missing:
+        prefix = ""
+        if existed:
+            content = env_file.read_bytes()
+            if content and not content.endswith(b"\n"):
+                prefix = "\n"
+        with open(env_file, 'a') as f:
+            f.write(prefix + "\n".join(f"{key}={value}" for key, value in missing.items()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _env.cache_clear()
+        for key, value in missing.items():
             print(f"   📝 Adicionando ao .env: {key}={value}")
     
-    if not env_file.exists():
+    if not existed:
         env_file.touch()
         print("📝 Arquivo .env criado - Configure sua OPENAI_API_KEY!")
-    elif updated:
+    elif missing:
         print("📝 Arquivo .env atualizado com novas variáveis!")
     else:
         print("ℹ️ Arquivo .env já existe e está atualizado com as variáveis padrão.")
 
 
-def create_requirements():
-    """Cria requirements.txt atualizado"""
-    requirements = """# Core dependencies
-pydantic-ai>=0.0.14
-openai>=1.0.0
-python-dotenv>=1.0.0
-psycopg2-binary>=2.9.0
-
-# Google Calendar API
-google-api-python-client>=2.100.0
-google-auth-oauthlib>=1.1.0
-google-auth-httplib2>=0.2.0
-
-# Optional dependencies for advanced features
-requests>=2.31.0
-asyncio-mqtt>=0.16.0
-schedule>=1.2.0
-
-# Development dependencies
-pytest>=7.4.0
-pytest-asyncio>=0.21.0
-black>=23.0.0
-flake8>=6.0.0
-
-# Logging
-colorlog>=6.7.0
-
-# Timezone support
-pytz>=2023.3
-"""
-    
-    Path("requirements.txt").write_text(requirements)
-    print("📋 requirements.txt atualizado")
-
-def create_gitignore():
-    """Cria .gitignore se não existir"""
-    gitignore_content = """# Python
-__pycache__/
-*.py[cod]
-*$py.class
-*.so
-.Python
-build/
-develop-eggs/
-dist/
-downloads/
-eggs/
-.eggs/
-lib/
-lib64/
-parts/sdist/
-var/
-wheels/
-*.egg-info/
-.installed.cfg
-*.egg
-
-# Environment
-.env
-.venv
-env/
-venv/
-ENV/
-env.bak/
-venv.bak/
-
-# IDE
-.vscode/
-.idea/
-*.swp
-*.swo
-*~
-
-# Logs
-logs/
-*.log
-
-# Data
-data/
-*.db
-*.sqlite
-
-# OS
-.DS_Store
-Thumbs.db
-
-# ChatBot specific
-user_data/
-chat_history/
-temp/
-"""
-    
-    gitignore_file = Path(".gitignore")
-    if not gitignore_file.exists():
-        gitignore_file.write_text(gitignore_content)
-        print("🚫 .gitignore criado")
-    else:
-        print("ℹ️ .gitignore já existe")
-
-def create_readme():
-    """Cria README.md do projeto"""
-    readme_content = """# 🤖 ChatBot Modular com PydanticAI
-
-Um chatbot inteligente e modular construído com PydanticAI, seguindo arquitetura de microserviços.
-
-## ✨ Características
-
-- 🧩 **Arquitetura Modular**: Cada ferramenta em arquivo separado
-- 🔧 **Auto-descoberta**: Carregamento automático de ferramentas
-- 💾 **Contexto Persistente**: Memória durante a sessão
-- 🎯 **Type Safety**: Validação completa com Pydantic
-- 🔄 **Hot Reload**: Adicione ferramentas sem reiniciar
-
-## 🚀 Instalação Rápida
-
-```bash
-# 1. Clonar e configurar
-git clone <repo_url>
-cd chatbot-modular
-
-# 2. Executar setup
-python setup.py
-
-# 3. Instalar dependências
-pip install -r requirements.txt
-
-# 4. Configurar API Key
-# Edite o arquivo .env e adicione sua OPENAI_API_KEY
-
-# 5. Executar
-python main.py
-```
-
-## 🛠️ Ferramentas Disponíveis
-
-- 🧮 **Calculadora**: Operações matemáticas avançadas
-- 🔐 **Gerador de Senhas**: Senhas seguras personalizáveis
-- 📝 **Gerenciador de Tarefas**: TO-DO list com prioridades
-- 📊 **Analisador de Texto**: Análise completa de textos
-- 🔄 **Conversor de Unidades**: Conversões universais
-
-## 🔧 Criando Nova Ferramenta
-
-1. Crie arquivo em `tools/minha_ferramenta.py`
-2. Implemente seguindo o padrão:
-
-```python
-from pydantic_ai import RunContext
-from models.context import ConversationContext
-from typing import Annotated
-
-def tool_metadata():
-    return {
-        "name": "minha_ferramenta",
-        "description": "Descrição da ferramenta", 
-        "version": "1.0.0",
-        "category": "categoria"
-    }
-
-async def minha_funcao(
-    ctx: RunContext[ConversationContext],
-    parametro: Annotated[str, "Descrição do parâmetro"]
-) -> str:
-    \"\"\"O que a ferramenta faz\"\"\"
-    # Sua lógica aqui
-    return "Resultado"
-
-minha_funcao.__tool_metadata__ = tool_metadata()
-```
-
-3. Reinicie o bot - será carregada automaticamente!
-
-## 📁 Estrutura do Projeto
-
-```
-chatbot-modular/
-├── config/          # Configurações
-├── core/            # Core do sistema
-├── models/          # Modelos Pydantic
-├── tools/           # Ferramentas (microserviços)
-├── tests/           # Testes automatizados
-├── logs/            # Arquivos de log
-├── data/            # Dados persistentes
-├── main.py          # Aplicação principal
-├── setup.py         # Script de configuração
-└── requirements.txt # Dependências
-```
-
-## 🎯 Comandos Disponíveis
-
-- `sair` - Encerrar chatbot
-- `stats` - Estatísticas da sessão
-- `tools` - Listar ferramentas disponíveis
-- `context` - Ver contexto atual
-
-## 🧪 Testes
-
-```bash
-# Executar todos os testes
-pytest
-
-# Testes específicos
-pytest tests/test_tools.py
-```
-
-## 📈 Roadmap
-
-- [ ] Interface web com FastAPI
-- [ ] Persistência em banco de dados
-- [ ] Sistema de plugins
-- [ ] API REST para ferramentas
-- [ ] Dashboard de monitoramento
-- [ ] Deploy com Docker
-
-## 🤝 Contribuição
-
-1. Fork o projeto
-2. Crie sua feature branch
-3. Adicione testes para novas ferramentas
-4. Commit suas mudanças
-5. Abra um Pull Request
-
-## 📄 Licença
-
-MIT License - veja LICENSE file para detalhes.
-
----
+def project_file_outputs():
+    """Lista (caminho, conteúdo, mensagem) dos arquivos do projeto a escrever"""
+    outputs = []
+    for path_str, (template, overwrite, message) in PROJECT_FILES.items():
+        path = Path(path_str)
+        if overwrite or not path.exists():
+            outputs.append((path, (TEMPLATES_DIR / template).read_bytes(), message))
+        else:
+            print(f"ℹ️ {path_str} já existe")
+    return outputs
 
-**Feito com ❤️ e PydanticAI**
-"""
-    
-    Path("README.md").write_text(readme_content)
-    print("📖 README.md criado")
+async def create_project_files():
+    """
+    Cria o .env, requirements.txt, .gitignore e README.md. As escritas são
+    independentes e rodam em paralelo: em sistemas de arquivos lentos (rede/NFS)
+    o tempo total fica perto do da escrita mais lenta, não da soma de todas.
+    """
+    outputs = project_file_outputs()
+    await asyncio.gather(
+        asyncio.to_thread(create_env_file),
+        *(asyncio.to_thread(path.write_bytes, content) for path, content, _ in outputs)
+    )
+    for _, _, message in outputs:
+        print(message)
 
 def install_dependencies():
     """
@@ -325,13 +156,16 @@ def install_dependencies():
     """
     print("\n📦 Instalando dependências do requirements.txt...")
     try:
-        # Usamos sys.executable para garantir que o pip do ambiente virtual seja usado
-        result = subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], check=True, capture_output=True, text=True)
+        # Usamos sys.executable para garantir que o pip do ambiente virtual seja usado.
+        # A saída do pip vai direto para o terminal, mostrando o progresso da instalação
+        subprocess.run(
+            [sys.executable, "-m", "pip", "--disable-pip-version-check", "--no-input",
+             "install", "-r", "requirements.txt"],
+            check=True
+        )
         print("   ✅ Dependências instaladas com sucesso!")
-        print(result.stdout)
     except subprocess.CalledProcessError as e:
         print(f"❌ Erro ao instalar dependências: {e}")
-        print(e.stderr)
         sys.exit(1)
     except FileNotFoundError:
         print("❌ 'pip' não encontrado. Certifique-se de que o Python e o pip estão no PATH.")
@@ -347,13 +181,17 @@ def setup_database():
     from psycopg2 import sql
 
     print("\n📦 Configurando banco de dados PostgreSQL...")
-    load_dotenv() # Garante que as variáveis de ambiente do .env sejam carregadas
+    # Expor as variáveis do .env (já lidas) para o módulo de persistência,
+    # sem sobrescrever as definidas no ambiente
+    for key, value in _env().items():
+        if value is not None:
+            os.environ.setdefault(key, value)
     
-    db_host = os.getenv('DB_HOST', 'localhost')
-    db_port = os.getenv('DB_PORT', '5432')
-    db_name = os.getenv('DB_NAME', 'chatbot_db')
-    db_user = os.getenv('DB_USER', 'chatbot_user')
-    db_password = os.getenv('DB_PASSWORD', 'password')
+    db_host = _setting('DB_HOST', 'localhost')
+    db_port = _setting('DB_PORT', '5432')
+    db_name = _setting('DB_NAME', 'chatbot_db')
+    db_user = _setting('DB_USER', 'chatbot_user')
+    db_password = _setting('DB_PASSWORD', 'password')
 
     conn_admin = None
     try:
@@ -361,32 +199,46 @@ def setup_database():
             host=db_host,
             database='postgres',
             user='postgres',
-            password=os.getenv('POSTGRES_SUPERUSER_PASSWORD', 'your_postgres_superuser_password'),
+            password=_setting('POSTGRES_SUPERUSER_PASSWORD', 'your_postgres_superuser_password'),
             port=db_port
         )
         conn_admin.autocommit = True
         cur_admin = conn_admin.cursor()
 
-        # 1. Criar o usuário para a aplicação se não existir
-        cur_admin.execute(f"SELECT 1 FROM pg_user WHERE usename = '{db_user}';")
-        if not cur_admin.fetchone():
-            cur_admin.execute(sql.SQL("CREATE USER {} WITH PASSWORD %s;").format(sql.Identifier(db_user)), (db_password,))
+        # 1. Criar o usuário para a aplicação se não existir (verificação e criação
+        #    numa única ida ao servidor; RAISE NOTICE informa o que aconteceu)
+        cur_admin.execute(
+            sql.SQL(
+                "DO $do$ BEGIN "
+                "IF NOT EXISTS (SELECT 1 FROM pg_user WHERE usename = %s) THEN "
+                "CREATE USER {user} WITH PASSWORD %s; RAISE NOTICE 'created'; "
+                "END IF; END $do$;"
+            ).format(user=sql.Identifier(db_user)),
+            (db_user, db_password)
+        )
+        if any('created' in notice for notice in conn_admin.notices):
             print(f"   ✅ Usuário '{db_user}' criado.")
         else:
             print(f"   ℹ️ Usuário '{db_user}' já existe.")
         
-        # 2. Criar o banco de dados se não existir
-        cur_admin.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}';")
+        # 2. Criar o banco de dados se não existir (CREATE DATABASE não roda dentro de DO)
+        cur_admin.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (db_name,))
         if not cur_admin.fetchone():
-            cur_admin.execute(sql.SQL("CREATE DATABASE {} OWNER {};").format(sql.Identifier(db_name), sql.Identifier(db_user)))
+            cur_admin.execute(
+                sql.SQL("CREATE DATABASE {db} OWNER {owner};").format(
+                    db=sql.Identifier(db_name), owner=sql.Identifier(db_user)
+                )
+            )
             print(f"   ✅ Banco de dados '{db_name}' criado e atribuído a '{db_user}'.")
         else:
             print(f"   ℹ️ Banco de dados '{db_name}' já existe.")
 
-        print("   🔗 Testando conexão com o novo banco de dados...")
-        if conn_admin:
-            conn_admin.close()
+        # A conexão administrativa não é mais necessária (o finally não fecha de novo)
+        conn_admin.close()
+        conn_admin = None
         
+        print("   🔗 Testando conexão com o novo banco de dados...")
+
         if create_tables_if_not_exists:
             create_tables_if_not_exists()
 
@@ -412,11 +264,8 @@ def main():
     print("="*50)
     
     try:
-        create_directory_structure()
-        create_env_file()
-        create_requirements()
-        create_gitignore() 
-        create_readme()
+        create_directory_structure() # Os diretórios vêm antes dos arquivos
+        asyncio.run(create_project_files())
         
         install_dependencies() # AQUI INSTALAMOS AS DEPENDENCIAS PRIMEIRO
 
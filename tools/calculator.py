@@ -2,6 +2,79 @@
 from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated
+from datetime import datetime
+from functools import lru_cache
+import ast
+import math
+import operator as op
+
+# Operadores e funções aceitos nas expressões
+_OPS = {
+    ast.Add: op.add, ast.Sub: op.sub,
+    ast.Mult: op.mul, ast.Div: op.truediv, ast.FloorDiv: op.floordiv,
+    ast.Pow: op.pow,
+    ast.USub: op.neg, ast.UAdd: op.pos,
+}
+_FUNCS = {
+    'sqrt': math.sqrt,
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+    'log': math.log, 'ln': math.log,
+}
+_CONSTS = {'pi': math.pi, 'e': math.e}
+
+# Caracteres possíveis numa expressão válida: expressão.translate(_DELETE_ALLOWED)
+# remove todos eles numa só passada em C; sobrar algo significa rejeição imediata
+_ALLOWED_CHARS = '0123456789+-*/().' + ''.join(sorted(set(''.join(_FUNCS) + ''.join(_CONSTS))))
+_DELETE_ALLOWED = str.maketrans('', '', _ALLOWED_CHARS)
+
+class UnsupportedExpression(ValueError):
+    """Expressão com algo além de números, operadores e funções permitidas"""
+
+# Limite do expoente, para que algo como 9^9^9 não trave o processo
+_MAX_EXPONENT = 10000
+
+# Limite de dígitos de resultados inteiros de potências e multiplicações: o
+# expoente sozinho não limita a base, e (10^10000)^10000 travaria o event loop.
+# Fica abaixo do limite de conversão int -> str do Python (4300 dígitos)
+_MAX_DIGITS = 4000
+_MAX_BITS = int(_MAX_DIGITS * math.log2(10))
+
+def _too_large(op_type, left, right) -> bool:
+    """Se o resultado inteiro de left op right passaria de _MAX_DIGITS dígitos"""
+    if type(left) is not int or type(right) is not int:
+        # Com floats o resultado é limitado (ou OverflowError) e calculado em tempo constante
+        return False
+    if op_type is ast.Pow:
+        return right > 0 and abs(left) > 1 and right * math.log10(abs(left)) > _MAX_DIGITS
+    if op_type is ast.Mult:
+        return left.bit_length() + right.bit_length() > _MAX_BITS
+    return False
+
+@lru_cache(maxsize=256)
+def _compile(expression: str) -> ast.expr:
+    """Analisa a expressão uma única vez por texto"""
+    return ast.parse(expression, mode='eval').body
+
+def _eval(node: ast.expr):
+    """Avalia a árvore aceitando apenas números, operadores e funções permitidas"""
+    node_type = type(node)
+    if node_type is ast.Constant and type(node.value) in (int, float):
+        return node.value
+    if node_type is ast.BinOp and type(node.op) in _OPS:
+        left, right = _eval(node.left), _eval(node.right)
+        if type(node.op) is ast.Pow and abs(right) > _MAX_EXPONENT:
+            raise UnsupportedExpression("expoente muito grande")
+        if _too_large(type(node.op), left, right):
+            raise UnsupportedExpression("resultado muito grande")
+        return _OPS[type(node.op)](left, right)
+    if node_type is ast.UnaryOp and type(node.op) in _OPS:
+        return _OPS[type(node.op)](_eval(node.operand))
+    if node_type is ast.Name and node.id in _CONSTS:
+        return _CONSTS[node.id]
+    if (node_type is ast.Call and type(node.func) is ast.Name and node.func.id in _FUNCS
+            and len(node.args) == 1 and not node.keywords):
+        return _FUNCS[node.func.id](_eval(node.args[0]))
+    raise UnsupportedExpression("operação não permitida")
 
 def tool_metadata():
     """Metadados da ferramenta"""
@@ -18,32 +91,24 @@ async def calculate(
     expression: Annotated[str, "Expressão matemática para calcular (ex: 2+2, sqrt(16), sin(30)"]
 ) -> str:
     """Calcula expressões matemáticas básicas e avançadas"""
-    import math
-    import re
     
     try:
         # Limpar expressão
-        expression = expression.replace(" ", "").lower()
-        
-        # Substituir funções matemáticas
-        replacements = {
-            'sqrt': 'math.sqrt',
-            'sin': 'math.sin', 'cos': 'math.cos', 'tan': 'math.tan',
-            'log': 'math.log', 'ln': 'math.log',
-            'pi': 'math.pi', 'e': 'math.e',
-            '^': '**'  # Exponenciação
-        }
+        expression = expression.replace(" ", "").lower().replace('^', '**')  # Exponenciação
         
-        for old, new in replacements.items():
-            expression = expression.replace(old, new)
-        
-        # Validar caracteres permitidos
-        allowed = set('0123456789+-*/().mathsqrtincoslogatnpe ')
-        if not all(c in allowed for c in expression):
+        # Rejeitar caracteres fora do permitido antes de analisar
+        if expression.translate(_DELETE_ALLOWED):
             return "❌ Operação não permitida. Use apenas números e funções matemáticas básicas."
         
         # Calcular
-        result = eval(expression)
+        try:
+            result = _eval(_compile(expression))
+        except (SyntaxError, UnsupportedExpression):
+            return "❌ Operação não permitida. Use apenas números e funções matemáticas básicas."
+        
+        # Formatar antes de mexer no histórico: um resultado que não pode ser
+        # exibido também não deve chegar ao contexto persistido
+        result_text = str(result)
         
         # Salvar no histórico do usuário
         history = ctx.deps.get_user_data('calc_history', [])
@@ -54,7 +119,7 @@ async def calculate(
         })
         ctx.deps.set_user_data('calc_history', history[-10:])  # Manter apenas 10
         
-        return f"🧮 {expression} = {result}"
+        return f"🧮 {expression} = {result_text}"
         
     except Exception as e:
         return f"❌ Erro no cálculo: {str(e)}"
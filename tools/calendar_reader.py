@@ -8,18 +8,34 @@ from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated
 from datetime import datetime, timedelta
-import pytz
-import os
-import pickle
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from tools import shared_calendar_auth
+
+# As bibliotecas do Google e o pytz são importados dentro das funções:
+# carregar esta ferramenta não deve custar o import delas em sessões sem calendário
 
 # Escopos necessários para ler o calendário
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
+# Formatos aceitos por parse_date_string quando a data não está em ISO
+_DATE_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+)
+
+_SP_TZ = None
+
+def _sp_tz():
+    """Fuso de São Paulo, criado (e pytz importado) na primeira chamada."""
+    global _SP_TZ
+    if _SP_TZ is None:
+        import pytz
+        _SP_TZ = pytz.timezone('America/Sao_Paulo')
+    return _SP_TZ
+
 def tool_metadata():
     """Metadados da ferramenta para listar compromissos."""
     return {
@@ -31,69 +47,28 @@ def tool_metadata():
     }
 
 def get_calendar_service():
-    """Obtém o serviço do Google Calendar autenticado."""
-    creds = None
-    token_file = 'data/calendar_token.pickle'
-    credentials_file = 'credentials.json'
-    
-    # Criar diretório data se não existir
-    os.makedirs('data', exist_ok=True)
-    
-    # Verificar se o token existe
-    if os.path.exists(token_file):
-        with open(token_file, 'rb') as token:
-            creds = pickle.load(token)
-    
-    # Se não há credenciais válidas, fazer login
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception:
-                # Remove token inválido
-                if os.path.exists(token_file):
-                    os.remove(token_file)
-                creds = None
-        
-        if not creds:
-            if not os.path.exists(credentials_file):
-                raise FileNotFoundError(
-                    "Arquivo credentials.json não encontrado. "
-                    "Configure no Google Cloud Console e coloque na raiz do projeto."
-                )
-            
-            flow = InstalledAppFlow.from_client_secrets_file(
-                credentials_file, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        # Salvar credenciais
-        with open(token_file, 'wb') as token:
-            pickle.dump(creds, token)
-    
-    return build('calendar', 'v3', credentials=creds)
+    """Obtém o serviço do Google Calendar autenticado, reaproveitando-o entre chamadas."""
+    return shared_calendar_auth.get_calendar_service(
+        token_file='data/calendar_token.json',
+        scopes=SCOPES,
+        credentials_file='credentials.json'
+    )
 
 def parse_date_string(date_str: str, default_tz=None) -> datetime:
     """Analisa string de data em vários formatos."""
-    if default_tz is None:
-        default_tz = pytz.timezone('America/Sao_Paulo')
+    date_str = date_str.strip()
     
-    # Tentar ISO format primeiro
-    try:
-        return datetime.fromisoformat(date_str)
-    except ValueError:
-        pass
+    # Tentar ISO format primeiro (só quando tem cara de ISO: AAAA-...)
+    if len(date_str) >= 10 and date_str[4] == '-':
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
     
-    # Formatos comuns
-    formats = [
-        '%Y-%m-%dT%H:%M:%S',
-        '%Y-%m-%d %H:%M:%S',
-        '%Y-%m-%d %H:%M',
-        '%Y-%m-%d',
-        '%d/%m/%Y %H:%M',
-        '%d/%m/%Y',
-    ]
+    if default_tz is None:
+        default_tz = _sp_tz()
     
-    for fmt in formats:
+    for fmt in _DATE_FORMATS:
         try:
             dt = datetime.strptime(date_str, fmt)
             if dt.tzinfo is None:
@@ -104,35 +79,39 @@ def parse_date_string(date_str: str, default_tz=None) -> datetime:
     
     raise ValueError(f"Não foi possível analisar a data: {date_str}")
 
+def _fmt_date(d) -> str:
+    """dd/mm/aaaa com formatação de inteiros (sem o parser de formato do strftime)"""
+    return f"{d.day:02d}/{d.month:02d}/{d.year}"
+
+def _fmt_time(dt) -> str:
+    """HH:MM"""
+    return f"{dt.hour:02d}:{dt.minute:02d}"
+
+def _fmt_datetime(dt) -> str:
+    """dd/mm/aaaa às HH:MM"""
+    return f"{dt.day:02d}/{dt.month:02d}/{dt.year} às {dt.hour:02d}:{dt.minute:02d}"
+
 def format_event_time(start_str: str, end_str: str) -> tuple:
     """Formata as datas de início e fim do evento."""
     try:
-        # Verificar se é evento de dia inteiro
-        if 'T' not in start_str:
-            start_date = datetime.fromisoformat(start_str).date()
-            end_date = datetime.fromisoformat(end_str).date()
-            
-            if start_date == end_date:
-                return start_date.strftime('%d/%m/%Y'), "", True
-            else:
-                return (f"{start_date.strftime('%d/%m/%Y')} - {end_date.strftime('%d/%m/%Y')}", 
-                       "", True)
-        else:
-            # Evento com horário específico
-            start_dt = datetime.fromisoformat(start_str)
-            end_dt = datetime.fromisoformat(end_str)
-            
-            start_formatted = start_dt.strftime('%d/%m/%Y às %H:%M')
-            
-            if start_dt.date() == end_dt.date():
-                end_formatted = end_dt.strftime('%H:%M')
-            else:
-                end_formatted = end_dt.strftime('%d/%m/%Y às %H:%M')
-            
-            return start_formatted, end_formatted, False
-            
+        # Analisadas uma única vez, para os dois tipos de evento
+        start_dt = datetime.fromisoformat(start_str)
+        end_dt = datetime.fromisoformat(end_str)
     except Exception:
         return start_str, end_str, False
+    
+    same_day = start_dt.date() == end_dt.date()
+    
+    # Evento de dia inteiro: a API envia só a data ('AAAA-MM-DD', 10 caracteres);
+    # com horário, o 'T' fica no índice 10 e a string é mais longa
+    if len(start_str) == 10:
+        if same_day:
+            return _fmt_date(start_dt), "", True
+        return f"{_fmt_date(start_dt)} - {_fmt_date(end_dt)}", "", True
+    
+    # Evento com horário específico
+    end_formatted = _fmt_time(end_dt) if same_day else _fmt_datetime(end_dt)
+    return _fmt_datetime(start_dt), end_formatted, False
 
 async def list_events(
     ctx: RunContext[ConversationContext],
@@ -142,10 +121,11 @@ async def list_events(
     calendar_id: Annotated[str, "ID do calendário específico (padrão: principal)"] = 'primary'
 ) -> str:
     """Lista os próximos compromissos do Google Calendar."""
+    from googleapiclient.errors import HttpError
     
     try:
         service = get_calendar_service()
-        sao_paulo_tz = pytz.timezone('America/Sao_Paulo')
+        sao_paulo_tz = _sp_tz()
 
         # Definir período de busca
         if time_min:
@@ -176,36 +156,38 @@ async def list_events(
         
         # Formatar resposta
         period_str = f"de {start_time_obj.strftime('%d/%m/%Y')} até {end_time_obj.strftime('%d/%m/%Y')}"
-        response = f"🗓️ **Seus próximos compromissos ({period_str}):**\n\n"
+        parts = [f"🗓️ **Seus próximos compromissos ({period_str}):**\n\n"]
         
-        for i, event in enumerate(events, 1):
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
-            summary = event.get('summary', 'Sem título')
-            location = event.get('location', '')
-            description = event.get('description', '')
-            
+        # Extrair cada campo em uma lista própria antes de formatar
+        starts = [e['start'].get('dateTime') or e['start'].get('date') for e in events]
+        ends = [e['end'].get('dateTime') or e['end'].get('date') for e in events]
+        summaries = [e.get('summary', 'Sem título') for e in events]
+        locations = [e.get('location', '') for e in events]
+        descriptions = [e.get('description', '') for e in events]
+        
+        for i, (start, end, summary, location, description) in enumerate(
+                zip(starts, ends, summaries, locations, descriptions), 1):
             # Formatar horário
             start_formatted, end_formatted, is_all_day = format_event_time(start, end)
             
-            response += f"**{i}. {summary}**\n"
+            parts.append(f"**{i}. {summary}**\n")
             
             if is_all_day:
-                response += f"📅 Data: {start_formatted}\n"
+                parts.append(f"📅 Data: {start_formatted}\n")
             else:
-                response += f"⏰ Início: {start_formatted}\n"
+                parts.append(f"⏰ Início: {start_formatted}\n")
                 if end_formatted:
-                    response += f"⏱️ Término: {end_formatted}\n"
+                    parts.append(f"⏱️ Término: {end_formatted}\n")
             
             if location:
-                response += f"📍 Local: {location}\n"
+                parts.append(f"📍 Local: {location}\n")
             
             if description and len(description) < 100:
-                response += f"📝 Descrição: {description[:97]}{'...' if len(description) > 97 else ''}\n"
+                parts.append(f"📝 Descrição: {description[:97]}{'...' if len(description) > 97 else ''}\n")
             
-            response += "\n"
+            parts.append("\n")
 
-        return response.strip()
+        return "".join(parts).strip()
 
     except FileNotFoundError as e:
         return f"❌ {str(e)}\n\n💡 Execute 'python config/setup_calendar.py' para configurar."
@@ -231,7 +213,7 @@ async def list_calendars(ctx: RunContext[ConversationContext]) -> str:
         if not calendars:
             return "📅 Nenhum calendário encontrado."
         
-        response = "📅 **Seus calendários disponíveis:**\n\n"
+        parts = ["📅 **Seus calendários disponíveis:**\n\n"]
         
         for calendar in calendars:
             name = calendar['summary']
@@ -239,20 +221,20 @@ async def list_calendars(ctx: RunContext[ConversationContext]) -> str:
             
             # Marcar calendário principal
             if calendar.get('primary', False) or 'gmail.com' in calendar_id:
-                response += f"⭐ **{name}** (Principal)\n"
+                parts.append(f"⭐ **{name}** (Principal)\n")
             else:
-                response += f"📋 **{name}**\n"
+                parts.append(f"📋 **{name}**\n")
             
-            response += f"   ID: `{calendar_id}`\n"
+            parts.append(f"   ID: `{calendar_id}`\n")
             
             if 'description' in calendar:
-                response += f"   Descrição: {calendar['description']}\n"
+                parts.append(f"   Descrição: {calendar['description']}\n")
             
-            response += "\n"
+            parts.append("\n")
         
-        response += "\n💡 **Dica:** Use o ID do calendário no parâmetro `calendar_id` para consultar um calendário específico."
+        parts.append("\n💡 **Dica:** Use o ID do calendário no parâmetro `calendar_id` para consultar um calendário específico.")
         
-        return response.strip()
+        return "".join(parts).strip()
         
     except Exception as e:
         return f"❌ Erro ao listar calendários: {str(e)}"
@@ -3,9 +3,27 @@ from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated, List
 from datetime import datetime, timedelta
-import pytz
 from tools.shared_calendar_auth import get_calendar_service # Importar o serviço
 
+SP_TZ_NAME = 'America/Sao_Paulo'
+_SP_TZ = None
+
+def _sp_tz():
+    """Fuso de São Paulo, criado (e pytz importado) na primeira chamada."""
+    global _SP_TZ
+    if _SP_TZ is None:
+        import pytz
+        _SP_TZ = pytz.timezone(SP_TZ_NAME)
+    return _SP_TZ
+
+def _parse_localize(value: str) -> datetime:
+    """
+    Converte uma data ISO 8601; sem offset, ela é considerada no fuso de São Paulo.
+    Levanta ValueError se o formato for inválido.
+    """
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo is not None else _sp_tz().localize(dt)
+
 def tool_metadata():
     """Metadados da ferramenta para agendar compromissos."""
     return {
@@ -31,23 +49,14 @@ async def create_event(
     try:
         service = get_calendar_service()
         
-        # Definir fuso horário para São Paulo para garantir consistência
-        sao_paulo_tz = pytz.timezone('America/Sao_Paulo')
-
-        # Converter strings de tempo para objetos datetime e adicionar fuso horário
-        # Se as strings já vierem com offset, fromisoformat lida com isso.
-        # Caso contrário, localize-as com o fuso horário de São Paulo.
+        # Strings com offset são usadas como vieram; sem offset, valem no fuso de São Paulo
         try:
-            start_dt = datetime.fromisoformat(start_time)
-            if start_dt.tzinfo is None:
-                start_dt = sao_paulo_tz.localize(start_dt)
+            start_dt = _parse_localize(start_time)
         except ValueError:
             return "❌ Formato de 'start_time' inválido. Use o formato ISO 8601 (ex: '2025-08-06T14:00:00-03:00')."
         
         try:
-            end_dt = datetime.fromisoformat(end_time)
-            if end_dt.tzinfo is None:
-                end_dt = sao_paulo_tz.localize(end_dt)
+            end_dt = _parse_localize(end_time)
         except ValueError:
             return "❌ Formato de 'end_time' inválido. Use o formato ISO 8601 (ex: '2025-08-06T15:00:00-03:00')."
 
@@ -60,11 +69,11 @@ async def create_event(
             'description': description,
             'start': {
                 'dateTime': start_dt.isoformat(),
-                'timeZone': 'America/Sao_Paulo',
+                'timeZone': SP_TZ_NAME,
             },
             'end': {
                 'dateTime': end_dt.isoformat(),
-                'timeZone': 'America/Sao_Paulo',
+                'timeZone': SP_TZ_NAME,
             },
             'attendees': [{'email': email} for email in attendees],
             'reminders': {
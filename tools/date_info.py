@@ -2,7 +2,16 @@
 from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated
-from datetime import datetime, date
+from datetime import datetime
+import time
+
+_DIAS_SEMANA = ('Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo')
+_MESES = ('Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+          'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro')
+
+# Última resposta e o segundo (epoch) a que ela se refere: a saída tem
+# resolução de segundos, então chamadas no mesmo segundo são idênticas
+_CACHE = (None, -1)
 
 def tool_metadata():
     """Metadados da ferramenta para obter informações de data e hora."""
@@ -18,18 +27,20 @@ async def informacoes_data(
     ctx: RunContext[ConversationContext]
 ) -> str:
     """Fornece informações sobre data e hora atual (dia, mês, ano, dia da semana, hora)."""
-    now = datetime.now() # O datetime.now() por padrão pega a hora local do servidor
-    hoje = date.today()
+    global _CACHE
+    second = int(time.time())
+    if _CACHE[1] == second:
+        return _CACHE[0]
     
-    dias_semana = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
-    meses = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-             'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+    now = datetime.fromtimestamp(second) # Hora local do servidor
     
-    dia_semana = dias_semana[hoje.weekday()]
-    mes = meses[hoje.month - 1]
+    dia_semana = _DIAS_SEMANA[now.weekday()]
+    mes = _MESES[now.month - 1]
     
-    return (f"📅 Hoje é {dia_semana}, {hoje.day} de {mes} de {hoje.year}\n"
-            f"🕐 Horário atual: {now.strftime('%H:%M:%S')}")
+    text = (f"📅 Hoje é {dia_semana}, {now.day} de {mes} de {now.year}\n"
+            f"🕐 Horário atual: {now.hour:02d}:{now.minute:02d}:{now.second:02d}")
+    _CACHE = (text, second)
+    return text
 
 # Marcar função como ferramenta
 informacoes_data.__tool_metadata__ = tool_metadata()
\ No newline at end of file
@@ -6,6 +6,33 @@ import string
 import random
 import secrets
 
+_SYMBOLS = "!@#$%^&*()-_=+[]{}|;:,.<>?"
+# Tabela de str.translate que remove os caracteres ambíguos
+_AMBIGUOUS_TABLE = str.maketrans('', '', "0O1lI")
+
+def _build_charset(include_numbers: bool, include_symbols: bool, exclude_ambiguous: bool) -> str:
+    """Base de caracteres para uma combinação de opções"""
+    chars = string.ascii_letters
+    if include_numbers:
+        chars += string.digits
+    if include_symbols:
+        chars += _SYMBOLS
+    if exclude_ambiguous:
+        chars = chars.translate(_AMBIGUOUS_TABLE)
+    return chars
+
+# Bases de caracteres de todas as combinações de opções, montadas uma vez:
+# (números, símbolos, excluir ambíguos) -> caracteres
+_CHARSETS = {
+    (numbers, symbols, ambiguous): _build_charset(numbers, symbols, ambiguous)
+    for numbers in (False, True)
+    for symbols in (False, True)
+    for ambiguous in (False, True)
+}
+
+# Gerador do sistema operacional (os.urandom), o mesmo usado pelo módulo secrets
+_RNG = secrets.SystemRandom()
+
 def tool_metadata():
     return {
         "name": "password_generator", 
@@ -28,30 +55,24 @@ async def generate_password(
         return "❌ Tamanho deve ser entre 4 e 128 caracteres"
     
     # Base de caracteres
-    chars = string.ascii_letters
-    
-    if include_numbers:
-        chars += string.digits
-    
-    if include_symbols:
-        chars += "!@#$%^&*()-_=+[]{}|;:,.<>?"
-    
-    # Remover caracteres ambíguos se solicitado
-    if exclude_ambiguous:
-        ambiguous = "0O1lI"
-        chars = ''.join(c for c in chars if c not in ambiguous)
+    chars = _CHARSETS[bool(include_numbers), bool(include_symbols), bool(exclude_ambiguous)]
     
-    # Gerar senha usando secrets (mais seguro)
-    password = ''.join(secrets.choice(chars) for _ in range(length))
+    # Gerar senha com o gerador criptográfico, num único sorteio de `length` caracteres
+    password = ''.join(_RNG.choices(chars, k=length))
     
     # Calcular força da senha
     strength = calculate_strength(password, length, include_numbers, include_symbols)
     
-    # Salvar estatística
-    stats = ctx.deps.get_user_data('password_stats', {'generated': 0, 'total_length': 0})
+    # Salvar estatística: só em memória; a gravação no banco acontece depois da
+    # resposta, junto com o turno (persist_turn), então não há escrita a adiar aqui
+    stats = ctx.deps.get_user_data('password_stats')
+    if stats is None:
+        stats = {'generated': 0, 'total_length': 0}
+        ctx.deps.set_user_data('password_stats', stats)
+    else:
+        ctx.deps.mark_dirty()
     stats['generated'] += 1
     stats['total_length'] += length
-    ctx.deps.set_user_data('password_stats', stats)
     
     return (
         f"🔐 Senha gerada: `{password}`\n"
@@ -69,8 +90,15 @@ def calculate_strength(password: str, length: int, has_numbers: bool, has_symbol
     
     if has_numbers: score += 1
     if has_symbols: score += 1
-    if any(c.isupper() for c in password): score += 1
-    if any(c.islower() for c in password): score += 1
+    # Uma única passada, que para assim que houver maiúscula e minúscula
+    has_upper = has_lower = False
+    for c in password:
+        has_upper |= c.isupper()
+        has_lower |= c.islower()
+        if has_upper and has_lower:
+            break
+    if has_upper: score += 1
+    if has_lower: score += 1
     
     if score >= 6: return "🔴 Muito Forte"
     elif score >= 4: return "🟡 Forte"  
@@ -1,34 +1,261 @@
 # 📁 tools/shared_calendar_auth.py
+# Só a biblioteca padrão no topo: googleapiclient, google-auth e oauthlib são
+# importados no primeiro uso do calendário, não ao carregar as ferramentas
 import os
-import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import threading
+from datetime import datetime, timezone
 
-# Se modificar esses escopos, delete o arquivo token.pickle.
+# Se modificar esses escopos, delete o arquivo token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
-def get_calendar_service():
-    """Mostra como autenticar e retornar o serviço da Google Calendar API."""
-    creds = None
-    # O arquivo token.pickle armazena os tokens de acesso e atualização do usuário,
+# Serviços já autenticados, por (arquivo de token, escopos): (credenciais, serviço)
+_SERVICES = {}
+# Serializa a construção de serviços (leitura do token, login, build)
+_SERVICE_LOCK = threading.Lock()
+
+# Cópia local do documento de discovery da Calendar API v3
+DISCOVERY_FILE = 'data/calendar_discovery.json'
+
+# Conexão HTTP compartilhada por todos os serviços (keep-alive com www.googleapis.com)
+_HTTP = None
+
+# Timeout das requisições à API (segundos)
+HTTP_TIMEOUT = 10
+
+# Chaves de _SERVICES com renovação de token em andamento
+_REFRESHING = set()
+_REFRESH_LOCK = threading.Lock()
+
+# Diretórios de token já garantidos neste processo
+_READY_DIRS = set()
+
+def _ensure_dir(directory: str):
+    """Cria o diretório na primeira vez; chamadas seguintes não fazem syscalls."""
+    if directory not in _READY_DIRS:
+        os.makedirs(directory, exist_ok=True)
+        _READY_DIRS.add(directory)
+
+def _shared_http():
+    """
+    httplib2.Http criado na primeira chamada e reaproveitado: as chamadas
+    das ferramentas de calendário (todas no loop do agente, uma por vez)
+    usam a mesma conexão TLS em vez de abrir uma por serviço.
+    """
+    global _HTTP
+    if _HTTP is None:
+        import httplib2
+        _HTTP = httplib2.Http(cache=None, timeout=HTTP_TIMEOUT)
+    return _HTTP
+
+def _discovery_document():
+    """
+    Documento de discovery da Calendar API v3, lido do disco. Na primeira vez
+    é copiado do documento estático que acompanha o googleapiclient.
+    Retorna None se nenhum estiver disponível (ele é baixado e salvo no build).
+    """
+    if os.path.exists(DISCOVERY_FILE):
+        with open(DISCOVERY_FILE, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    from googleapiclient.discovery_cache import get_static_doc
+    doc = get_static_doc('calendar', 'v3')
+    if doc is not None:
+        _save_discovery_document(doc)
+    return doc
+
+def _save_discovery_document(doc: str):
+    """Grava o documento de discovery (arquivo temporário + rename)"""
+    _ensure_dir(os.path.dirname(DISCOVERY_FILE))
+    tmp_path = DISCOVERY_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(doc)
+    os.replace(tmp_path, DISCOVERY_FILE)
+
+def _save_credentials(creds, token_file: str):
+    """Salva as credenciais para a próxima execução"""
+    from core.oauth_scheduler import write_token_atomically
+    write_token_atomically(creds, token_file)
+
+def _load_credentials(token_file: str, credentials_file: str, scopes: tuple):
+    """Carrega as credenciais do token salvo, renovando ou refazendo o login se preciso."""
+    # Importados só quando o calendário é usado, não ao carregar as ferramentas
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    from core.oauth_scheduler import read_token
+
+    _ensure_dir(os.path.dirname(token_file) or '.')
+
+    # O arquivo de token (JSON) armazena os tokens de acesso e atualização do usuário,
     # e é criado automaticamente quando o fluxo de autorização é concluído pela primeira vez.
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
+    creds = read_token(token_file, list(scopes))
+
     # Se não houver credenciais (válidas) disponíveis, permita que o usuário faça login.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
+            try:
+                creds.refresh(Request())
+            except Exception:
+                # Remove token inválido
+                if os.path.exists(token_file):
+                    os.remove(token_file)
+                creds = None
+
+        if not creds:
             # Baixe o arquivo credentials.json do Google Cloud Console
-            # e coloque-o na mesma pasta que este script.
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
+            # e coloque-o na raiz do projeto.
+            if not os.path.exists(credentials_file):
+                raise FileNotFoundError(
+                    "Arquivo credentials.json não encontrado. "
+                    "Configure no Google Cloud Console e coloque na raiz do projeto."
+                )
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, list(scopes))
             creds = flow.run_local_server(port=0)
-        # Salve as credenciais para a próxima execução
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
 
-    service = build('calendar', 'v3', credentials=creds)
-    return service
\ No newline at end of file
+        _save_credentials(creds, token_file)
+
+    return creds
+
+def _discard_service(key: tuple, creds):
+    """
+    Remove o serviço do cache, mas só se ele ainda usa estas credenciais: outra
+    thread pode já tê-lo reconstruído (sob _SERVICE_LOCK) com credenciais novas.
+    """
+    with _SERVICE_LOCK:
+        cached = _SERVICES.get(key)
+        if cached is not None and cached[0] is creds:
+            del _SERVICES[key]
+
+def _refresh_and_persist(key: tuple, creds, token_file: str):
+    """Renova o token em segundo plano e o salva; se falhar, descarta o serviço do cache."""
+    from google.auth.transport.requests import Request
+    try:
+        old_token = creds.token
+        creds.refresh(Request())
+        if creds.token != old_token:
+            _save_credentials(creds, token_file)
+    except Exception:
+        # Recomeçar do token salvo (ou de um novo login) na próxima chamada
+        _discard_service(key, creds)
+    finally:
+        with _REFRESH_LOCK:
+            _REFRESHING.discard(key)
+
+def _claim_refresh(key: tuple) -> bool:
+    """Marca a chave como em renovação; False se outra thread já a está renovando"""
+    with _REFRESH_LOCK:
+        if key in _REFRESHING:
+            return False
+        _REFRESHING.add(key)
+        return True
+
+def _start_refresh(key: tuple, creds, token_file: str):
+    """Dispara (uma vez por chave) a renovação do token numa thread daemon"""
+    if not _claim_refresh(key):
+        return
+    threading.Thread(
+        target=_refresh_and_persist, args=(key, creds, token_file), daemon=True
+    ).start()
+
+def _seconds_until_refresh(creds) -> float:
+    """Segundos até o início da margem de renovação antecipada (<= 0: já dentro dela)"""
+    from core.oauth_scheduler import REFRESH_MARGIN
+    # O google-auth guarda `expiry` como datetime UTC sem fuso
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - REFRESH_MARGIN - now).total_seconds()
+
+def refresh_expiring_credentials(token_files=()):
+    """
+    Renova as credenciais que já entraram na margem de renovação: as dos
+    serviços em cache (o mesmo objeto usado pelo AuthorizedHttp) e, para os
+    arquivos de `token_files` ainda sem serviço em cache, o token salvo em disco.
+    Retorna os segundos até a próxima renovação, ou None se não houver token renovável.
+    """
+    from core.oauth_scheduler import read_token
+
+    with _SERVICE_LOCK:
+        pending = [(key, creds) for key, (creds, _) in _SERVICES.items()]
+    cached_files = {key[0] for key, _ in pending}
+    for token_file in token_files:
+        if token_file not in cached_files:
+            creds = read_token(token_file)
+            if creds is not None:
+                # Chave fora de _SERVICES: serve só para evitar renovações simultâneas
+                pending.append(((token_file, None), creds))
+
+    next_refresh = None
+    for key, creds in pending:
+        if not creds.refresh_token or creds.expiry is None:
+            continue
+        delay = _seconds_until_refresh(creds)
+        if delay <= 0 and _claim_refresh(key):
+            _refresh_and_persist(key, creds, key[0])
+            delay = _seconds_until_refresh(creds)
+        next_refresh = delay if next_refresh is None else min(next_refresh, delay)
+    return next_refresh
+
+def get_calendar_service(token_file: str = 'token.json', scopes=SCOPES,
+                         credentials_file: str = 'credentials.json'):
+    """
+    Retorna o serviço autenticado da Google Calendar API.
+    O serviço é construído uma única vez por token e reaproveitado entre
+    chamadas; só as credenciais são renovadas (o serviço usa o mesmo objeto
+    Credentials): em segundo plano quando faltam poucos minutos para o token
+    expirar, ou antes da chamada se ele já expirou.
+    """
+    key = (token_file, tuple(scopes))
+    cached = _SERVICES.get(key)
+    if cached is not None:
+        creds, service = cached
+        if not creds.valid and creds.refresh_token and _claim_refresh(key):
+            # Já expirado: o AuthorizedHttp renovaria de qualquer forma antes da
+            # requisição, então renovar (e salvar) aqui, sem thread
+            _refresh_and_persist(key, creds, token_file)
+        if creds.valid:
+            if creds.refresh_token and creds.expiry and _seconds_until_refresh(creds) <= 0:
+                # Ainda válido, mas perto de expirar: renovar fora do caminho da
+                # chamada, que segue com o token atual
+                _start_refresh(key, creds, token_file)
+            return service
+        if key in _REFRESHING:
+            # Renovação em segundo plano ainda em andamento; se ela não terminar
+            # antes da requisição, o AuthorizedHttp renova sozinho
+            return service
+        _discard_service(key, creds)
+
+    with _SERVICE_LOCK:
+        # Outra thread pode ter construído o serviço enquanto esta esperava
+        cached = _SERVICES.get(key)
+        if cached is not None:
+            return cached[1]
+        return _build_service(key, token_file, credentials_file)
+
+def _build_service(key: tuple, token_file: str, credentials_file: str):
+    """Carrega as credenciais, constrói o serviço e o guarda em _SERVICES"""
+    from googleapiclient.discovery import build, build_from_document
+    from google_auth_httplib2 import AuthorizedHttp
+
+    creds = _load_credentials(token_file, credentials_file, key[1])
+    # AuthorizedHttp usa o mesmo objeto Credentials: renovações valem para o serviço
+    http = AuthorizedHttp(creds, http=_shared_http())
+    doc = _discovery_document()
+    if doc is not None:
+        # Sem busca do discovery: o serviço é montado a partir do documento local
+        service = build_from_document(doc, http=http)
+    else:
+        # Sem documento estático: baixar uma vez e salvar, para que as próximas
+        # execuções montem o serviço sem ir à rede
+        import json
+        service = build('calendar', 'v3', http=http, cache_discovery=False,
+                        static_discovery=False)
+        _save_discovery_document(json.dumps(service._rootDesc))
+    _SERVICES[key] = (creds, service)
+    return service
+
+def invalidate_service(token_file: str = None):
+    """Descarta os serviços em cache (de um arquivo de token, ou todos)"""
+    with _SERVICE_LOCK:
+        if token_file is None:
+            _SERVICES.clear()
+            return
+        for key in [key for key in _SERVICES if key[0] == token_file]:
+            del _SERVICES[key]
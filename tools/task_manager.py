@@ -2,7 +2,97 @@
 from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated, List, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+import time
+
+# Versão da estrutura de tarefas (3: 'prio_rank' e 'due_date_ordinal' gravados em cada tarefa)
+_TASKS_VERSION = 3
+
+# Emoji e ordem de exibição de cada prioridade
+_PRIORITY_EMOJI = {'low': '🟢', 'medium': '🟡', 'high': '🔴'}
+_PRIORITY_RANK = {'high': 1, 'medium': 2, 'low': 3}
+
+def _new_tasks_data() -> Dict[str, Any]:
+    """
+    Estrutura de tarefas indexada por ID. As chaves são strings (IDs) para
+    sobreviver à serialização em JSON; 'pending' e 'completed' são dicts usados
+    como conjuntos ordenados (ID -> None), e os contadores evitam varreduras.
+    """
+    return {
+        'version': _TASKS_VERSION,
+        'by_id': {},
+        'pending': {},
+        'completed': {},
+        'priorities_pending': {'high': 0, 'medium': 0, 'low': 0},
+        'next_id': 1,
+        'completed_count': 0,
+        # Atrasadas calculadas uma vez por dia: {'day': ordinal de hoje, 'count': n}
+        'overdue_cache': None
+    }
+
+def _set_derived_fields(t: Dict[str, Any]):
+    """Campos calculados uma vez por tarefa: ordem de prioridade e data limite como ordinal"""
+    t['prio_rank'] = _PRIORITY_RANK[t['priority']]
+    t['due_date_ordinal'] = (
+        datetime.strptime(t['due_date'], '%Y-%m-%d').toordinal() if t['due_date'] else None
+    )
+
+def _migrate_tasks_data(tasks_data: Dict[str, Any]) -> bool:
+    """Converte (uma única vez) as tarefas de formatos antigos. Retorna True se converteu."""
+    if tasks_data.get('version') == _TASKS_VERSION:
+        return False
+    if 'by_id' in tasks_data:
+        # Já indexado por ID: só faltam os campos calculados
+        for t in tasks_data['by_id'].values():
+            _set_derived_fields(t)
+        tasks_data['version'] = _TASKS_VERSION
+        tasks_data['overdue_cache'] = None
+        return True
+    
+    migrated = _new_tasks_data()
+    migrated['next_id'] = tasks_data.get('next_id', 1)
+    migrated['completed_count'] = tasks_data.get('completed_count', 0)
+    for t in tasks_data.get('tasks', []):
+        _set_derived_fields(t)
+        key = str(t['id'])
+        migrated['by_id'][key] = t
+        if t['completed']:
+            migrated['completed'][key] = None
+        else:
+            migrated['pending'][key] = None
+            migrated['priorities_pending'][t['priority']] += 1
+    tasks_data.clear()
+    tasks_data.update(migrated)
+    return True
+
+def _overdue_count(tasks_data: Dict[str, Any]) -> int:
+    """Tarefas pendentes vencidas, recalculadas só na primeira consulta do dia"""
+    today_ord = date.today().toordinal()
+    cached = tasks_data['overdue_cache']
+    if cached is not None and cached['day'] == today_ord:
+        return cached['count']
+    
+    by_id = tasks_data['by_id']
+    # Comparação de inteiros, sem analisar as datas a cada consulta
+    count = 0
+    for key in tasks_data['pending']:
+        due = by_id[key]['due_date_ordinal']
+        if due is not None and due < today_ord:
+            count += 1
+    tasks_data['overdue_cache'] = {'day': today_ord, 'count': count}
+    return count
+
+def _save_tasks(ctx: RunContext[ConversationContext], tasks_data: Dict[str, Any], stored: bool):
+    """
+    Registra uma alteração real nas tarefas. Se a estrutura já é o objeto
+    guardado no contexto (alterado no lugar), basta marcar o contexto para
+    ser salvo; caminhos sem alteração não chamam esta função.
+    """
+    if stored:
+        ctx.deps.mark_dirty()
+    else:
+        ctx.deps.set_user_data('tasks', tasks_data)
 
 def tool_metadata():
     return {
@@ -24,25 +114,31 @@ async def manage_task(
     """Gerencia tarefas com prioridades e datas limite"""
     
     # Inicializar estrutura de tarefas
-    tasks_data = ctx.deps.get_user_data('tasks', {
-        'tasks': [],
-        'next_id': 1,
-        'completed_count': 0
-    })
+    tasks_data = ctx.deps.get_user_data('tasks')
+    # Usuário sem tarefas: a estrutura só é guardada no contexto na primeira alteração
+    stored = tasks_data is not None
+    if not stored:
+        tasks_data = _new_tasks_data()
+    elif _migrate_tasks_data(tasks_data):
+        ctx.deps.mark_dirty()
+    
+    by_id = tasks_data['by_id']
+    pending_ids = tasks_data['pending']
+    completed_ids = tasks_data['completed']
     
     if action == 'add':
         if not task:
             return "❌ Forneça a descrição da tarefa"
         
         # Validar prioridade
-        if priority not in ['low', 'medium', 'high']:
+        if priority not in _PRIORITY_EMOJI:
             priority = 'medium'
         
         # Validar data limite
-        due_datetime = None
+        due_date_ordinal = None
         if due_date:
             try:
-                due_datetime = datetime.strptime(due_date, '%Y-%m-%d')
+                due_date_ordinal = datetime.strptime(due_date, '%Y-%m-%d').toordinal()
             except ValueError:
                 return "❌ Formato de data inválido. Use YYYY-MM-DD"
         
@@ -51,121 +147,118 @@ async def manage_task(
             'id': tasks_data['next_id'],
             'description': task,
             'priority': priority,
+            # Chave de ordenação calculada uma vez, na criação
+            'prio_rank': _PRIORITY_RANK[priority],
             'due_date': due_date,
-            'created': datetime.now().isoformat(),
+            'due_date_ordinal': due_date_ordinal,
+            # Epoch em nanossegundos: sem formatar datas a cada escrita
+            'created_ns': time.time_ns(),
             'completed': False,
-            'completed_date': None
+            'completed_ns': None
         }
         
-        tasks_data['tasks'].append(new_task)
+        key = str(new_task['id'])
+        by_id[key] = new_task
+        pending_ids[key] = None
+        tasks_data['priorities_pending'][priority] += 1
         tasks_data['next_id'] += 1
-        ctx.deps.set_user_data('tasks', tasks_data)
+        if due_date:
+            tasks_data['overdue_cache'] = None
+        _save_tasks(ctx, tasks_data, stored)
         
-        priority_emoji = {'low': '🟢', 'medium': '🟡', 'high': '🔴'}[priority]
         due_info = f" (vence em {due_date})" if due_date else ""
         
-        return f"✅ Tarefa adicionada: #{new_task['id']} {priority_emoji} {task}{due_info}"
+        return f"✅ Tarefa adicionada: #{new_task['id']} {_PRIORITY_EMOJI[priority]} {task}{due_info}"
     
     elif action == 'list':
-        tasks = tasks_data['tasks']
-        if not tasks:
+        if not by_id:
             return "📝 Nenhuma tarefa cadastrada!"
         
-        # Separar pendentes e completas
-        pending = [t for t in tasks if not t['completed']]
-        completed = [t for t in tasks if t['completed']]
-        
-        result = "📋 SUAS TAREFAS:\n\n"
+        parts = ["📋 SUAS TAREFAS:\n\n"]
         
-        if pending:
-            result += "⏳ PENDENTES:\n"
-            for t in sorted(pending, key=lambda x: {'high': 1, 'medium': 2, 'low': 3}[x['priority']]):
-                priority_emoji = {'low': '🟢', 'medium': '🟡', 'high': '🔴'}[t['priority']]
+        if pending_ids:
+            parts.append("⏳ PENDENTES:\n")
+            pending = sorted((by_id[key] for key in pending_ids), key=itemgetter('prio_rank'))
+            for t in pending:
                 due_info = f" 📅{t['due_date']}" if t['due_date'] else ""
-                result += f"   {priority_emoji} #{t['id']} - {t['description']}{due_info}\n"
+                parts.append(f"   {_PRIORITY_EMOJI[t['priority']]} #{t['id']} - {t['description']}{due_info}\n")
         
-        if completed:
-            result += f"\n✅ COMPLETAS ({len(completed)}):\n"
-            for t in completed[-3:]:  # Mostrar apenas as 3 mais recentes
-                result += f"   ✓ #{t['id']} - {t['description']}\n"
+        if completed_ids:
+            parts.append(f"\n✅ COMPLETAS ({len(completed_ids)}):\n")
+            for key in list(completed_ids)[-3:]:  # Mostrar apenas as 3 mais recentes
+                t = by_id[key]
+                parts.append(f"   ✓ #{t['id']} - {t['description']}\n")
         
-        result += f"\n📊 Total: {len(pending)} pendentes, {len(completed)} completas"
-        return result
+        parts.append(f"\n📊 Total: {len(pending_ids)} pendentes, {len(completed_ids)} completas")
+        return "".join(parts)
     
     elif action == 'complete':
         if task_id <= 0:
             return "❌ Forneça o ID da tarefa"
         
-        for t in tasks_data['tasks']:
-            if t['id'] == task_id and not t['completed']:
-                t['completed'] = True
-                t['completed_date'] = datetime.now().isoformat()
-                tasks_data['completed_count'] += 1
-                ctx.deps.set_user_data('tasks', tasks_data)
-                
-                return f"🎉 Tarefa #{task_id} concluída: {t['description']}"
+        key = str(task_id)
+        if key not in pending_ids:
+            return f"❌ Tarefa #{task_id} não encontrada ou já está completa"
+        
+        t = by_id[key]
+        t['completed'] = True
+        t['completed_ns'] = time.time_ns()
+        del pending_ids[key]
+        completed_ids[key] = None
+        tasks_data['priorities_pending'][t['priority']] -= 1
+        tasks_data['completed_count'] += 1
+        if t['due_date']:
+            tasks_data['overdue_cache'] = None
+        _save_tasks(ctx, tasks_data, stored)
         
-        return f"❌ Tarefa #{task_id} não encontrada ou já está completa"
+        return f"🎉 Tarefa #{task_id} concluída: {t['description']}"
     
     elif action == 'remove':
         if task_id <= 0:
             return "❌ Forneça o ID da tarefa"
         
-        original_count = len(tasks_data['tasks'])
-        tasks_data['tasks'] = [t for t in tasks_data['tasks'] if t['id'] != task_id]
+        key = str(task_id)
+        t = by_id.pop(key, None)
+        if t is None:
+            return f"❌ Tarefa #{task_id} não encontrada"
         
-        if len(tasks_data['tasks']) < original_count:
-            ctx.deps.set_user_data('tasks', tasks_data)
-            return f"🗑️ Tarefa #{task_id} removida!"
+        if key in pending_ids:
+            del pending_ids[key]
+            tasks_data['priorities_pending'][t['priority']] -= 1
+            if t['due_date']:
+                tasks_data['overdue_cache'] = None
         else:
-            return f"❌ Tarefa #{task_id} não encontrada"
+            completed_ids.pop(key, None)
+        _save_tasks(ctx, tasks_data, stored)
+        return f"🗑️ Tarefa #{task_id} removida!"
     
     elif action == 'search':
         if not task:
             return "❌ Forneça o termo de busca"
         
-        matching = [
-            t for t in tasks_data['tasks'] 
-            if task.lower() in t['description'].lower()
-        ]
+        term = task.lower()
+        matching = [t for t in by_id.values() if term in t['description'].lower()]
         
         if not matching:
             return f"🔍 Nenhuma tarefa encontrada com: '{task}'"
         
-        result = f"🔍 Encontradas {len(matching)} tarefa(s):\n"
+        parts = [f"🔍 Encontradas {len(matching)} tarefa(s):\n"]
         for t in matching:
             status = "✅" if t['completed'] else "⏳"
-            priority = {'low': '🟢', 'medium': '🟡', 'high': '🔴'}[t['priority']]
-            result += f"   {status} #{t['id']} {priority} {t['description']}\n"
+            parts.append(f"   {status} #{t['id']} {_PRIORITY_EMOJI[t['priority']]} {t['description']}\n")
         
-        return result
+        return "".join(parts)
     
     elif action == 'stats':
-        tasks = tasks_data['tasks']
-        pending = len([t for t in tasks if not t['completed']])
-        completed = len([t for t in tasks if t['completed']])
-        
-        # Tarefas por prioridade
-        priorities = {'high': 0, 'medium': 0, 'low': 0}
-        for t in tasks:
-            if not t['completed']:
-                priorities[t['priority']] += 1
-        
-        # Tarefas vencendo
-        overdue = 0
-        if pending > 0:
-            today = datetime.now().date()
-            for t in tasks:
-                if not t['completed'] and t['due_date']:
-                    due = datetime.strptime(t['due_date'], '%Y-%m-%d').date()
-                    if due < today:
-                        overdue += 1
+        # Contadores mantidos a cada alteração: sem varrer as tarefas
+        priorities = tasks_data['priorities_pending']
+        overdue = _overdue_count(tasks_data) if pending_ids else 0
         
         return (
             f"📊 ESTATÍSTICAS DAS TAREFAS:\n"
-            f"   📝 Total: {len(tasks)}\n"
-            f"   ⏳ Pendentes: {pending}\n"
-            f"   ✅ Completas: {completed}\n"
+            f"   📝 Total: {len(by_id)}\n"
+            f"   ⏳ Pendentes: {len(pending_ids)}\n"
+            f"   ✅ Completas: {len(completed_ids)}\n"
             f"   🔴 Alta prioridade: {priorities['high']}\n"
             f"   🟡 Média prioridade: {priorities['medium']}\n"
             f"   🟢 Baixa prioridade: {priorities['low']}\n"
@@ -1,10 +1,90 @@
 # 📁 tools/text_analyzer.py
 from pydantic_ai import RunContext
 from models.context import ConversationContext
-from typing import Annotated
+from typing import Annotated, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from heapq import nlargest
+from itertools import islice
+from operator import itemgetter
 import re
 from collections import Counter
 
+# Separadores de frase e pontuação removida das bordas das palavras
+_SENT_RE = re.compile(r'[.!?]+')
+_STRIP_CHARS = '.,!?;:"()[]{}'
+_NON_SPACE_RE = re.compile(r'\S')
+
+# Tamanho máximo analisado: limita o tempo (e a memória) de textos colados enormes
+_MAX_CHARS = 200_000
+
+# Palavras positivas e negativas básicas em português
+_POSITIVE = frozenset({
+    'bom', 'boa', 'ótimo', 'ótima', 'excelente', 'maravilhoso', 'fantástico', 
+    'incrível', 'perfeito', 'adorei', 'amei', 'feliz', 'alegre', 'satisfeito',
+    'positivo', 'sucesso', 'vitória', 'conquistar', 'vencer', 'legal', 'massa'
+})
+
+_NEGATIVE = frozenset({
+    'ruim', 'péssimo', 'péssima', 'horrível', 'terrível', 'odiei', 
+    'detesto', 'triste', 'chateado', 'frustrado', 'negativo', 'fracasso',
+    'derrota', 'perder', 'problema', 'erro', 'difícil', 'impossível'
+})
+
+# Palavras irrelevantes (stop words) em português
+_STOP = frozenset({
+    'a', 'o', 'e', 'de', 'do', 'da', 'em', 'um', 'uma', 'com', 'por', 'para',
+    'se', 'que', 'não', 'na', 'no', 'como', 'mas', 'ou', 'ao', 'até', 'dos',
+    'das', 'seu', 'sua', 'seus', 'suas', 'ele', 'ela', 'eles', 'elas', 'isso',
+    'isto', 'aquilo', 'este', 'esta', 'estes', 'estas', 'esse', 'essa', 'esses',
+    'essas', 'aquele', 'aquela', 'aqueles', 'aquelas', 'ser', 'estar', 'ter',
+    'haver', 'foi', 'são', 'está', 'tem', 'mais', 'muito', 'bem', 'já', 'só'
+})
+
+@dataclass(slots=True, frozen=True)
+class TokenStats:
+    """Tokenização de um texto, compartilhada pelas análises"""
+    raw_words: Tuple[str, ...]
+    # Palavras em minúsculas, sem pontuação nas bordas
+    norm_words: Tuple[str, ...]
+    freq: Counter
+    sentences: int
+    paragraphs: int
+
+def _count_paragraphs(text: str) -> int:
+    """
+    Conta os trechos separados por linha em branco ('\\n\\n') que têm algum
+    conteúdo, sem montar a lista de trechos: cada um é testado no lugar com
+    uma busca de regex limitada por pos/endpos.
+    """
+    count = 0
+    start = 0
+    while True:
+        end = text.find('\n\n', start)
+        if end == -1:
+            end = len(text)
+        if _NON_SPACE_RE.search(text, start, end):
+            count += 1
+        if end == len(text):
+            return count
+        start = end + 2
+
+@lru_cache(maxsize=8)
+def _tokenize(text: str) -> TokenStats:
+    """
+    Divide e normaliza o texto uma única vez. O cache cobre o caso do agente
+    pedir várias análises do mesmo texto em sequência.
+    """
+    raw_words = tuple(text.split())
+    norm_words = tuple([word.lower().strip(_STRIP_CHARS) for word in raw_words])
+    return TokenStats(
+        raw_words=raw_words,
+        norm_words=norm_words,
+        freq=Counter(norm_words),
+        sentences=sum(1 for s in _SENT_RE.split(text) if s.strip()),
+        paragraphs=_count_paragraphs(text)
+    )
+
 def tool_metadata():
     return {
         "name": "text_analyzer",
@@ -24,52 +104,60 @@ async def analyze_text(
     if not text.strip():
         return "❌ Forneça um texto para analisar"
     
+    truncated = len(text) > _MAX_CHARS
+    if truncated:
+        text = text[:_MAX_CHARS]
+    
     if analysis_type == 'basic':
-        return basic_analysis(text)
+        result = basic_analysis(text)
     elif analysis_type == 'detailed':
-        return detailed_analysis(text)
+        result = detailed_analysis(text)
     elif analysis_type == 'sentiment':
-        return sentiment_analysis(text)
+        result = sentiment_analysis(text)
     elif analysis_type == 'keywords':
-        return keyword_analysis(text)
+        result = keyword_analysis(text)
     else:
         return "❌ Tipo de análise inválido. Use: basic, detailed, sentiment, keywords"
+    
+    if truncated:
+        result += f"\n   ✂️ Texto truncado: analisados apenas os primeiros {_MAX_CHARS:,} caracteres"
+    return result
 
 def basic_analysis(text: str) -> str:
     """Análise básica do texto"""
-    words = text.split()
-    sentences = re.split(r'[.!?]+', text)
-    paragraphs = text.split('\n\n')
+    stats = _tokenize(text)
+    words = stats.raw_words
     
-    chars_no_spaces = len(text.replace(' ', ''))
+    chars_no_spaces = len(text) - text.count(' ')
     
     return (
         f"📝 ANÁLISE BÁSICA:\n"
         f"   📊 Caracteres: {len(text)}\n"
         f"   🔤 Caracteres (sem espaços): {chars_no_spaces}\n"  
         f"   💬 Palavras: {len(words)}\n"
-        f"   📄 Frases: {len([s for s in sentences if s.strip()])}\n"
-        f"   📋 Parágrafos: {len([p for p in paragraphs if p.strip()])}\n"
+        f"   📄 Frases: {stats.sentences}\n"
+        f"   📋 Parágrafos: {stats.paragraphs}\n"
         f"   ⏱️ Tempo de leitura: ~{max(1, len(words) // 200)} min"
     )
 
 def detailed_analysis(text: str) -> str:
     """Análise detalhada do texto"""
-    words = text.split()
+    stats = _tokenize(text)
+    words = stats.raw_words
     
-    # Contagem de tipos de caracteres
-    letters = sum(1 for c in text if c.isalpha())
-    numbers = sum(1 for c in text if c.isdigit()) 
-    spaces = sum(1 for c in text if c.isspace())
-    punctuation = sum(1 for c in text if c in '.,!?;:"()[]{}')
+    # Contagem de tipos de caracteres: map com os métodos de str e str.count
+    # percorrem o texto em C, sem um laço Python por caractere
+    letters = sum(map(str.isalpha, text))
+    numbers = sum(map(str.isdigit, text))
+    spaces = sum(map(str.isspace, text))
+    punctuation = sum(map(text.count, _STRIP_CHARS))
     
     # Análise de palavras
-    word_lengths = [len(w.strip('.,!?;:"()[]{}')) for w in words]
+    word_lengths = [len(w) for w in stats.norm_words]
     avg_word_length = sum(word_lengths) / len(word_lengths) if word_lengths else 0
     
-    # Palavras mais comuns
-    word_freq = Counter(word.lower().strip('.,!?;:"()[]{}') for word in words)
-    most_common = word_freq.most_common(5)
+    # Palavras mais comuns (most_common(n) já usa um heap de n itens)
+    most_common = stats.freq.most_common(3)
     
     return (
         f"📊 ANÁLISE DETALHADA:\n"
@@ -80,28 +168,19 @@ def detailed_analysis(text: str) -> str:
         f"   💬 Total de palavras: {len(words)}\n"
         f"   📏 Média de caracteres por palavra: {avg_word_length:.1f}\n"
         f"   📋 Palavra mais longa: {max(word_lengths) if word_lengths else 0} chars\n"
-        f"   🏆 Palavras mais frequentes: {', '.join([f'{w}({c})' for w, c in most_common[:3]])}"
+        f"   🏆 Palavras mais frequentes: {', '.join([f'{w}({c})' for w, c in most_common])}"
     )
 
 def sentiment_analysis(text: str) -> str:
     """Análise de sentimento básica"""
-    # Palavras positivas e negativas básicas em português
-    positive_words = {
-        'bom', 'boa', 'ótimo', 'ótima', 'excelente', 'maravilhoso', 'fantástico', 
-        'incrível', 'perfeito', 'adorei', 'amei', 'feliz', 'alegre', 'satisfeito',
-        'positivo', 'sucesso', 'vitória', 'conquistar', 'vencer', 'legal', 'massa'
-    }
-    
-    negative_words = {
-        'ruim', 'péssimo', 'péssima', 'horrível', 'terrível', 'odiei', 
-        'detesto', 'triste', 'chateado', 'frustrado', 'negativo', 'fracasso',
-        'derrota', 'perder', 'problema', 'erro', 'difícil', 'impossível'
-    }
-    
-    words = [word.lower().strip('.,!?;:"()[]{}') for word in text.split()]
+    stats = _tokenize(text)
+    words = stats.norm_words
     
-    positive_count = sum(1 for word in words if word in positive_words)
-    negative_count = sum(1 for word in words if word in negative_words)
+    # Interseção em C entre o vocabulário e cada léxico (percorre o menor dos
+    # dois); só as palavras encontradas voltam ao Python para somar
+    freq = stats.freq
+    positive_count = sum(freq[word] for word in freq.keys() & _POSITIVE)
+    negative_count = sum(freq[word] for word in freq.keys() & _NEGATIVE)
     
     # Calcular sentimento
     if positive_count > negative_count:
@@ -125,42 +204,40 @@ def sentiment_analysis(text: str) -> str:
 
 def keyword_analysis(text: str) -> str:
     """Extrai palavras-chave do texto"""
-    # Palavras irrelevantes (stop words) em português
-    stop_words = {
-        'a', 'o', 'e', 'de', 'do', 'da', 'em', 'um', 'uma', 'com', 'por', 'para',
-        'se', 'que', 'não', 'na', 'no', 'como', 'mas', 'ou', 'ao', 'até', 'dos',
-        'das', 'seu', 'sua', 'seus', 'suas', 'ele', 'ela', 'eles', 'elas', 'isso',
-        'isto', 'aquilo', 'este', 'esta', 'estes', 'estas', 'esse', 'essa', 'esses',
-        'essas', 'aquele', 'aquela', 'aqueles', 'aquelas', 'ser', 'estar', 'ter',
-        'haver', 'foi', 'são', 'está', 'tem', 'mais', 'muito', 'bem', 'já', 'só'
-    }
-    
-    # Limpar e filtrar palavras
-    words = [word.lower().strip('.,!?;:"()[]{}') for word in text.split()]
-    filtered_words = [w for w in words if w and len(w) > 2 and w not in stop_words]
-    
-    # Contar frequências
-    word_freq = Counter(filtered_words)
-    
-    # Palavras-chave (mais de 1 ocorrência)
-    keywords = [(word, count) for word, count in word_freq.most_common() if count > 1]
-    
-    # Palavras únicas importantes (mais de 4 caracteres)
-    unique_important = [word for word, count in word_freq.items() 
-                       if count == 1 and len(word) > 4][:10]
+    stats = _tokenize(text)
+    
+    # Filtrar palavras (a partir das frequências já contadas)
+    word_freq = Counter({
+        w: count for w, count in stats.freq.items()
+        if w and len(w) > 2 and w not in _STOP
+    })
+    filtered_total = sum(word_freq.values())
+    
+    # Palavras-chave (mais de 1 ocorrência): só as 8 maiores são ordenadas (heap),
+    # sem ordenar o vocabulário inteiro
+    keyword_total = sum(1 for count in word_freq.values() if count > 1)
+    top_keywords = [
+        (word, count) for word, count in nlargest(8, word_freq.items(), key=itemgetter(1))
+        if count > 1
+    ]
+    
+    # Palavras únicas importantes (mais de 4 caracteres): para nas 5 exibidas
+    unique_important = list(islice(
+        (word for word, count in word_freq.items() if count == 1 and len(word) > 4), 5
+    ))
     
     result = f"🔍 ANÁLISE DE PALAVRAS-CHAVE:\n"
     
-    if keywords:
+    if top_keywords:
         result += f"   🏷️ Palavras-chave principais:\n"
-        for word, count in keywords[:8]:
+        for word, count in top_keywords:
             result += f"      • {word} ({count}x)\n"
     
     if unique_important:
-        result += f"   ✨ Termos únicos relevantes: {', '.join(unique_important[:5])}\n"
+        result += f"   ✨ Termos únicos relevantes: {', '.join(unique_important)}\n"
     
     result += f"   📊 Vocabulário único: {len(word_freq)} palavras distintas\n"
-    result += f"   🎯 Densidade de palavras-chave: {len(keywords)}/{len(filtered_words)}"
+    result += f"   🎯 Densidade de palavras-chave: {keyword_total}/{filtered_total}"
     
     return result
 
@@ -2,8 +2,110 @@
 from pydantic_ai import RunContext
 from models.context import ConversationContext
 from typing import Annotated, Dict, Callable
+from datetime import datetime
+from functools import lru_cache
 import math
 
+# Conversões mantidas no histórico do usuário
+_MAX_HISTORY = 20
+
+# Conversões multiplicativas: (origem, destino) -> fator
+_FACTORS: Dict[tuple, float] = {
+    # DISTÂNCIA
+    ('km', 'milhas'): 0.621371,
+    ('milhas', 'km'): 1.60934,
+    ('m', 'ft'): 3.28084,
+    ('ft', 'm'): 0.3048,
+    ('cm', 'in'): 0.393701,
+    ('in', 'cm'): 2.54,
+    ('km', 'm'): 1000,
+    ('m', 'km'): 1 / 1000,
+    ('m', 'cm'): 100,
+    ('cm', 'm'): 1 / 100,
+    
+    # PESO
+    ('kg', 'lb'): 2.20462,
+    ('lb', 'kg'): 0.453592,
+    ('g', 'oz'): 0.035274,
+    ('oz', 'g'): 28.3495,
+    ('kg', 'g'): 1000,
+    ('g', 'kg'): 1 / 1000,
+    ('ton', 'kg'): 1000,
+    ('kg', 'ton'): 1 / 1000,
+    
+    # VOLUME
+    ('l', 'gal'): 0.264172,
+    ('gal', 'l'): 3.78541,
+    ('ml', 'floz'): 0.033814,
+    ('floz', 'ml'): 29.5735,
+    ('l', 'ml'): 1000,
+    ('ml', 'l'): 1 / 1000,
+    
+    # ÁREA
+    ('m2', 'ft2'): 10.7639,
+    ('ft2', 'm2'): 0.092903,
+    ('km2', 'milha2'): 0.386102,
+    ('milha2', 'km2'): 2.58999,
+    
+    # VELOCIDADE
+    ('kmh', 'mph'): 0.621371,
+    ('mph', 'kmh'): 1.60934,
+    ('ms', 'kmh'): 3.6,
+    ('kmh', 'ms'): 1 / 3.6,
+    
+    # PRESSÃO
+    ('bar', 'psi'): 14.5038,
+    ('psi', 'bar'): 0.0689476,
+    ('atm', 'bar'): 1.01325,
+    ('bar', 'atm'): 0.986923,
+    
+    # ENERGIA
+    ('cal', 'j'): 4.184,
+    ('j', 'cal'): 0.239006,
+    ('kwh', 'j'): 3600000,
+    ('j', 'kwh'): 1 / 3600000,
+}
+
+# Conversões afins (TEMPERATURA): (origem, destino) -> (deslocamento antes, fator, deslocamento depois),
+# ou seja, resultado = (valor + antes) * fator + depois
+_AFFINE: Dict[tuple, tuple] = {
+    ('celsius', 'fahrenheit'): (0, 9 / 5, 32),
+    ('fahrenheit', 'celsius'): (-32, 5 / 9, 0),
+    ('celsius', 'kelvin'): (0, 1, 273.15),
+    ('kelvin', 'celsius'): (-273.15, 1, 0),
+    ('fahrenheit', 'kelvin'): (-32, 5 / 9, 273.15),
+    ('kelvin', 'fahrenheit'): (-273.15, 9 / 5, 32),
+}
+
+# Aliases comuns dos nomes de unidades
+_ALIASES = {
+    'quilometros': 'km', 'kilometros': 'km', 'quilômetros': 'km',
+    'metros': 'm', 'centimetros': 'cm', 'centímetros': 'cm',
+    'milhas': 'milhas', 'pes': 'ft', 'pés': 'ft', 'polegadas': 'in',
+    'graus': 'celsius', '°c': 'celsius', '°f': 'fahrenheit', '°k': 'kelvin',
+    'quilos': 'kg', 'kilos': 'kg', 'gramas': 'g', 'libras': 'lb',
+    'litros': 'l', 'mililitros': 'ml', 'galoes': 'gal', 'galões': 'gal',
+    'metro quadrado': 'm2', 'quilometro quadrado': 'km2',
+    'quilômetro por hora': 'kmh', 'metros por segundo': 'ms',
+    'calorias': 'cal', 'joules': 'j', 'quilowatt hora': 'kwh'
+}
+
+# Categoria de cada unidade
+_UNIT_CATEGORIES = {
+    unit: category
+    for category, units in {
+        'distância': ['km', 'milhas', 'm', 'ft', 'cm', 'in'],
+        'temperatura': ['celsius', 'fahrenheit', 'kelvin'],
+        'peso': ['kg', 'lb', 'g', 'oz', 'ton'],
+        'volume': ['l', 'gal', 'ml', 'floz'],
+        'área': ['m2', 'ft2', 'km2', 'milha2'],
+        'velocidade': ['kmh', 'mph', 'ms'],
+        'pressão': ['bar', 'psi', 'atm'],
+        'energia': ['cal', 'j', 'kwh']
+    }.items()
+    for unit in units
+}
+
 def tool_metadata():
     return {
         "name": "unit_converter",
@@ -25,39 +127,31 @@ async def convert_units(
     if precision < 0 or precision > 10:
         precision = 4
     
-    # Dicionário com todas as conversões
-    conversions = get_conversion_table()
-    
     # Normalizar nomes das unidades
     from_unit = normalize_unit_name(from_unit)
     to_unit = normalize_unit_name(to_unit)
     
-    # Verificar se conversão existe
-    conversion_key = (from_unit, to_unit)
+    converted = _pure_convert(value, from_unit, to_unit)
+    if converted is None:
+        return (f"❌ Conversão não suportada: {from_unit} → {to_unit}\n"
+               f"💡 Use 'listar conversoes' para ver opções disponíveis")
+    result, category = converted
     
-    if conversion_key in conversions:
-        # Conversão direta
-        result = conversions[conversion_key](value)
-        category = get_unit_category(from_unit)
+    # Salvar no histórico (a lista guardada é alterada no lugar, sem cópias)
+    history = ctx.deps.get_user_data('conversion_history')
+    if history is None:
+        history = []
+        ctx.deps.set_user_data('conversion_history', history)
     else:
-        # Tentar conversão via unidade base
-        base_conversions = find_base_conversion(from_unit, to_unit, conversions)
-        if base_conversions:
-            result = base_conversions(value)
-            category = get_unit_category(from_unit)
-        else:
-            return (f"❌ Conversão não suportada: {from_unit} → {to_unit}\n"
-                   f"💡 Use 'listar conversoes' para ver opções disponíveis")
-    
-    # Salvar no histórico
-    history = ctx.deps.get_user_data('conversion_history', [])
+        ctx.deps.mark_dirty()
     history.append({
         'from': f"{value} {from_unit}",
         'to': f"{result} {to_unit}",
         'category': category,
         'timestamp': str(datetime.now())
     })
-    ctx.deps.set_user_data('conversion_history', history[-20:])  # Manter 20
+    if len(history) > _MAX_HISTORY:
+        del history[:-_MAX_HISTORY]  # Manter 20
     
     # Informações extras baseadas na categoria
     extra_info = get_category_info(category, result, to_unit)
@@ -69,108 +163,46 @@ async def convert_units(
         f"   📈 Conversões realizadas: {len(history)}"
     )
 
+@lru_cache(maxsize=1024)
+def _pure_convert(value: float, from_unit: str, to_unit: str):
+    """
+    Parte pura da conversão (unidades já normalizadas): (resultado, categoria),
+    ou None se não houver conversão. Memoizada, já que o agente costuma repetir
+    a mesma conversão ao reformular a resposta; a precisão só afeta a formatação.
+    """
+    # Verificar se conversão existe (tabelas montadas uma vez, no import)
+    conversion_key = (from_unit, to_unit)
+    
+    factor = _FACTORS.get(conversion_key)
+    if factor is not None:
+        # Conversão direta
+        result = value * factor
+    elif conversion_key in _AFFINE:
+        before, factor, after = _AFFINE[conversion_key]
+        result = (value + before) * factor + after
+    else:
+        # Tentar conversão via unidade base
+        base_conversions = find_base_conversion(from_unit, to_unit, _FACTORS)
+        if not base_conversions:
+            return None
+        result = base_conversions(value)
+    return result, get_unit_category(from_unit)
+
 def get_conversion_table() -> Dict[tuple, Callable]:
-    """Retorna tabela completa de conversões"""
-    return {
-        # DISTÂNCIA
-        ('km', 'milhas'): lambda x: x * 0.621371,
-        ('milhas', 'km'): lambda x: x * 1.60934,
-        ('m', 'ft'): lambda x: x * 3.28084,
-        ('ft', 'm'): lambda x: x * 0.3048,
-        ('cm', 'in'): lambda x: x * 0.393701,
-        ('in', 'cm'): lambda x: x * 2.54,
-        ('km', 'm'): lambda x: x * 1000,
-        ('m', 'km'): lambda x: x / 1000,
-        ('m', 'cm'): lambda x: x * 100,
-        ('cm', 'm'): lambda x: x / 100,
-        
-        # TEMPERATURA
-        ('celsius', 'fahrenheit'): lambda x: (x * 9/5) + 32,
-        ('fahrenheit', 'celsius'): lambda x: (x - 32) * 5/9,
-        ('celsius', 'kelvin'): lambda x: x + 273.15,
-        ('kelvin', 'celsius'): lambda x: x - 273.15,
-        ('fahrenheit', 'kelvin'): lambda x: (x - 32) * 5/9 + 273.15,
-        ('kelvin', 'fahrenheit'): lambda x: (x - 273.15) * 9/5 + 32,
-        
-        # PESO
-        ('kg', 'lb'): lambda x: x * 2.20462,
-        ('lb', 'kg'): lambda x: x * 0.453592,
-        ('g', 'oz'): lambda x: x * 0.035274,
-        ('oz', 'g'): lambda x: x * 28.3495,
-        ('kg', 'g'): lambda x: x * 1000,
-        ('g', 'kg'): lambda x: x / 1000,
-        ('ton', 'kg'): lambda x: x * 1000,
-        ('kg', 'ton'): lambda x: x / 1000,
-        
-        # VOLUME
-        ('l', 'gal'): lambda x: x * 0.264172,
-        ('gal', 'l'): lambda x: x * 3.78541,
-        ('ml', 'floz'): lambda x: x * 0.033814,
-        ('floz', 'ml'): lambda x: x * 29.5735,
-        ('l', 'ml'): lambda x: x * 1000,
-        ('ml', 'l'): lambda x: x / 1000,
-        
-        # ÁREA
-        ('m2', 'ft2'): lambda x: x * 10.7639,
-        ('ft2', 'm2'): lambda x: x * 0.092903,
-        ('km2', 'milha2'): lambda x: x * 0.386102,
-        ('milha2', 'km2'): lambda x: x * 2.58999,
-        
-        # VELOCIDADE
-        ('kmh', 'mph'): lambda x: x * 0.621371,
-        ('mph', 'kmh'): lambda x: x * 1.60934,
-        ('ms', 'kmh'): lambda x: x * 3.6,
-        ('kmh', 'ms'): lambda x: x / 3.6,
-        
-        # PRESSÃO
-        ('bar', 'psi'): lambda x: x * 14.5038,
-        ('psi', 'bar'): lambda x: x * 0.0689476,
-        ('atm', 'bar'): lambda x: x * 1.01325,
-        ('bar', 'atm'): lambda x: x * 0.986923,
-        
-        # ENERGIA
-        ('cal', 'j'): lambda x: x * 4.184,
-        ('j', 'cal'): lambda x: x * 0.239006,
-        ('kwh', 'j'): lambda x: x * 3600000,
-        ('j', 'kwh'): lambda x: x / 3600000,
-    }
+    """Retorna tabela completa de conversões (como funções, para quem precisar)"""
+    table = {key: (lambda x, f=factor: x * f) for key, factor in _FACTORS.items()}
+    for key, (before, factor, after) in _AFFINE.items():
+        table[key] = lambda x, b=before, f=factor, a=after: (x + b) * f + a
+    return table
 
 def normalize_unit_name(unit: str) -> str:
     """Normaliza nome da unidade"""
     unit = unit.lower().strip()
-    
-    # Aliases comuns
-    aliases = {
-        'quilometros': 'km', 'kilometros': 'km', 'quilômetros': 'km',
-        'metros': 'm', 'centimetros': 'cm', 'centímetros': 'cm',
-        'milhas': 'milhas', 'pes': 'ft', 'pés': 'ft', 'polegadas': 'in',
-        'graus': 'celsius', '°c': 'celsius', '°f': 'fahrenheit', '°k': 'kelvin',
-        'quilos': 'kg', 'kilos': 'kg', 'gramas': 'g', 'libras': 'lb',
-        'litros': 'l', 'mililitros': 'ml', 'galoes': 'gal', 'galões': 'gal',
-        'metro quadrado': 'm2', 'quilometro quadrado': 'km2',
-        'quilômetro por hora': 'kmh', 'metros por segundo': 'ms',
-        'calorias': 'cal', 'joules': 'j', 'quilowatt hora': 'kwh'
-    }
-    
-    return aliases.get(unit, unit)
+    return _ALIASES.get(unit, unit)
 
 def get_unit_category(unit: str) -> str:
     """Retorna categoria da unidade"""
-    categories = {
-        'distância': ['km', 'milhas', 'm', 'ft', 'cm', 'in'],
-        'temperatura': ['celsius', 'fahrenheit', 'kelvin'],
-        'peso': ['kg', 'lb', 'g', 'oz', 'ton'],
-        'volume': ['l', 'gal', 'ml', 'floz'],
-        'área': ['m2', 'ft2', 'km2', 'milha2'],
-        'velocidade': ['kmh', 'mph', 'ms'],
-        'pressão': ['bar', 'psi', 'atm'],
-        'energia': ['cal', 'j', 'kwh']
-    }
-    
-    for category, units in categories.items():
-        if unit in units:
-            return category
-    return 'geral'
+    return _UNIT_CATEGORIES.get(unit, 'geral')
 
 def find_base_conversion(from_unit: str, to_unit: str, conversions: Dict) -> Callable:
     """Encontra conversão via unidade base"""